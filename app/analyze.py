@@ -0,0 +1,121 @@
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional
+
+# تحليل وصف المستخدم في مرور واحد: تعبير منتظم واحد مُجمّع (alternation) يُبنى مرة عند الاستيراد،
+# ويستخرج الروابط والأوقات والفترات (كل ساعة/أسبوع/كل N دقائق) ونيّة تيليغرام معًا.
+
+# كلمة مفتاحية → نوع الجدولة
+SCHEDULE_KEYWORDS: Dict[str, str] = {
+    "كل يوم": "daily", "كل يومٍ": "daily", "يوميا": "daily", "يومياً": "daily", "يوميًا": "daily",
+    "كل صباح": "daily", "كل مساء": "daily",
+    "every day": "daily", "everyday": "daily", "daily": "daily", "every morning": "daily", "every evening": "daily",
+    "كل ساعة": "hourly", "every hour": "hourly", "hourly": "hourly",
+    "كل اسبوع": "weekly", "كل أسبوع": "weekly", "اسبوعيا": "weekly", "أسبوعيا": "weekly", "أسبوعيًا": "weekly",
+    "every week": "weekly", "weekly": "weekly",
+}
+WEEKDAYS: Dict[str, int] = {
+    "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6,
+    "الأحد": 0, "الاحد": 0, "الإثنين": 1, "الاثنين": 1, "الثلاثاء": 2, "الأربعاء": 3, "الاربعاء": 3,
+    "الخميس": 4, "الجمعة": 5, "السبت": 6,
+}
+TELEGRAM_WORDS = ("telegram", "تيليغرام", "تلغرام", "تليغرام", "تليجرام", "تيليجرام", "تلجرام")
+_UNITS = {"minute": "minutes", "minutes": "minutes", "min": "minutes", "mins": "minutes",
+          "دقيقة": "minutes", "دقائق": "minutes", "دقيقه": "minutes",
+          "hour": "hours", "hours": "hours", "ساعة": "hours", "ساعات": "hours", "ساعه": "hours"}
+
+def _alt(words) -> str:
+    # الأطول أولاً حتى لا تسبق "كل يوم" عبارة "كل يومٍ"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+# كل البدائل تبدأ عند بداية كلمة (مع سابقة عربية اختيارية و/ف/ب/ل): يتخطى المحرك معظم المواضع بسرعة.
+# النص يُمرَّر بحروف صغيرة (أسرع من IGNORECASE)؛ \d يطابق الأرقام العربية الهندية و int() يفهمها.
+_SCAN = re.compile(
+    r"(?<!\w)[وفبل]?(?:"
+    r"(?P<url>https?://[^\s\"'<>]+)"
+    r"|(?P<time>(?<!\d)(?P<h>\d{1,2})\s*[:：]\s*(?P<m>\d{2})(?!\d))"
+    r"|(?P<hour_ar>الساعة\s+(?P<h2>\d{1,2})(?![\d:：]))"
+    r"|(?P<every>(?:every|كل)\s+(?P<n>\d{1,3})\s*(?P<unit>" + _alt(_UNITS) + r"))"
+    r"|(?P<kw>" + _alt(SCHEDULE_KEYWORDS) + r")"
+    r"|(?P<day>" + _alt(WEEKDAYS) + r")"
+    r"|(?P<tg>" + _alt(TELEGRAM_WORDS) + r"))"
+)
+
+class PromptInfo:
+    __slots__ = ("interval", "every", "hour", "minute", "weekday", "urls", "telegram", "keywords")
+
+    def __init__(self) -> None:
+        self.interval: Optional[str] = None  # daily | hourly | weekly | minutes | hours
+        self.every: int = 1
+        self.hour: Optional[int] = None
+        self.minute: Optional[int] = None
+        self.weekday: Optional[int] = None
+        self.urls: List[str] = []
+        self.telegram: bool = False
+        self.keywords: List[str] = []
+
+    @property
+    def scheduled(self) -> bool:
+        return self.interval is not None or self.hour is not None or self.weekday is not None
+
+    @property
+    def url(self) -> Optional[str]:
+        return self.urls[0] if self.urls else None
+
+    def cron_params(self) -> Dict[str, Any]:
+        """params لخطوة cron: hour/minute للجدولة اليومية/الأسبوعية، وإلا تعبير cron مباشر."""
+        h = 9 if self.hour is None else self.hour
+        mi = self.minute or 0
+        interval, every = self.interval, self.every
+        # خطوة cron لا تتجاوز مدى الحقل: "كل 90 دقيقة" → كل ساعتين تقريبًا، "كل 48 ساعة" → كل يومين
+        if interval == "minutes" and every >= 60:
+            interval, every = "hours", max(1, round(every / 60))
+        if interval == "hours" and every >= 24:
+            days = max(1, round(every / 24))
+            return {"cron": f"{mi} {h} */{days} * *" if days > 1 else f"{mi} {h} * * *"}
+        if interval == "minutes":
+            return {"cron": f"*/{every} * * * *"}
+        if interval == "hours":
+            return {"cron": f"{mi} */{every} * * *"}
+        if self.interval == "hourly":
+            return {"cron": f"{mi} * * * *"}
+        if self.interval == "weekly" or self.weekday is not None:
+            return {"hour": h, "minute": mi, "weekday": 1 if self.weekday is None else self.weekday}
+        return {"hour": h, "minute": mi}
+
+    def __repr__(self) -> str:
+        return "PromptInfo(" + ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__) + ")"
+
+def analyze(prompt: str) -> PromptInfo:
+    info = PromptInfo()
+    text = prompt.lower()
+    if len(text) != len(prompt):  # حروف نادرة يتغير طولها عند lower(): نحافظ على مواضع الروابط
+        text = prompt
+    for m in _SCAN.finditer(text):
+        kind = m.lastgroup
+        if kind == "url":
+            # الرابط من النص الأصلي (المسار حساس لحالة الأحرف)
+            info.urls.append(prompt[m.start("url"):m.end("url")].rstrip(".,،)"))
+        elif kind == "time":
+            if info.hour is None:
+                info.hour = min(23, int(m.group("h")))
+                info.minute = min(59, int(m.group("m")))
+        elif kind == "hour_ar":
+            if info.hour is None:
+                info.hour, info.minute = min(23, int(m.group("h2"))), 0
+        elif kind == "every":
+            n = int(m.group("n"))
+            info.interval = _UNITS[m.group("unit")]
+            info.every = max(1, n)
+            info.keywords.append(m.group(0))
+        elif kind == "kw":
+            word = m.group("kw")
+            # الفترات الأدق (hourly/minutes) لا تُستبدل بكلمة أعم لاحقة
+            if info.interval is None:
+                info.interval = SCHEDULE_KEYWORDS[word]
+            info.keywords.append(word)
+        elif kind == "day":
+            info.weekday = WEEKDAYS[m.group("day")]
+        elif kind == "tg":
+            info.telegram = True
+    return info
@@ -0,0 +1,267 @@
+"""
+توليد workflows دفعة واحدة بدون البوت (مثلًا بعد تعديل القوالب):
+
+    python -m app.batch prompts.jsonl -o workflows.jsonl
+    python -m app.batch prompts.jsonl --out-dir out/ --workers 8 --chunk 128
+    cat prompts.jsonl | python -m app.batch - --llm --llm-concurrency 4 --llm-rps 2 > workflows.jsonl
+
+كل سطر إدخال: نص JSON، أو كائن فيه prompt/text/body/title (و id اختياري).
+الإخراج بنفس ترتيب الإدخال: سطر {"id", "source", "workflow"} لكل طلب، أو ملف <id>.json في --out-dir.
+"""
+from __future__ import annotations
+import os, sys, time, asyncio, argparse, logging
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import serde
+from .analyze import analyze
+from .compiler import compile_plan
+from .generator import default_plan
+from .ratelimit import TokenBucket
+from .router import IntentRouter
+from .spec import Plan
+from .validators import validate_plan
+
+logger = logging.getLogger("app.batch")
+
+PROMPT_KEYS = ("prompt", "text", "body", "title")
+STAGES = ("analyze", "route", "plan", "compile", "serialize")
+
+Item = Dict[str, Any]          # {"id", "prompt", "plan"?}
+Result = Tuple[str, str, bytes]  # (id, source|error, workflow bytes أو رسالة الخطأ)
+
+def read_items(lines: Iterable[str]) -> Iterator[Item]:
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = serde.loads(line)
+        except ValueError:
+            obj = line  # سطر نص عادي
+        if isinstance(obj, str):
+            yield {"id": str(n), "prompt": obj}
+        elif isinstance(obj, dict):
+            prompt = next((obj[k] for k in PROMPT_KEYS if isinstance(obj.get(k), str)), None)
+            yield {"id": str(obj.get("id") or obj.get("request_id") or n), "prompt": prompt}
+        else:
+            yield {"id": str(n), "prompt": None}
+
+def _chunks(items: Iterable[Item], size: int) -> Iterator[List[Item]]:
+    chunk: List[Item] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ==== داخل عمليات الـ pool ====
+
+_router: Optional[IntentRouter] = None
+_skeletons = serde.SkeletonCache()
+
+def compile_chunk(items: List[Item]) -> Tuple[List[Result], Dict[str, float]]:
+    """نفس مسار البوت بدون LLM: قالب جاهز (هيكل مسلسل) أو خطة الـ LLM المرفقة أو الخطة الافتراضية."""
+    global _router
+    if _router is None:
+        _router = IntentRouter()
+    times = dict.fromkeys(STAGES, 0.0)
+    out: List[Result] = []
+    for item in items:
+        prompt = item.get("prompt")
+        if not prompt:
+            out.append((item["id"], "error", b"missing prompt"))
+            continue
+        try:
+            t0 = time.perf_counter()
+            info = analyze(prompt)
+            t1 = time.perf_counter()
+            hit = _router.match(prompt, info)
+            t2 = time.perf_counter()
+            times["analyze"] += t1 - t0
+            times["route"] += t2 - t1
+            if hit is not None:
+                tpl, values = hit
+                data = _skeletons.render(tpl.name, lambda m: compile_plan(tpl.make(**m)), values)
+                times["serialize"] += time.perf_counter() - t2
+                out.append((item["id"], "template", data))
+                continue
+            source = "default"
+            plan = None
+            if item.get("plan") is not None:
+                plan, source = Plan.model_validate(item["plan"]), "llm"
+            if plan is None:
+                plan = default_plan(prompt, info)
+            t3 = time.perf_counter()
+            workflow = compile_plan(plan)
+            t4 = time.perf_counter()
+            data = serde.dumps(workflow)
+            t5 = time.perf_counter()
+            times["plan"] += t3 - t2
+            times["compile"] += t4 - t3
+            times["serialize"] += t5 - t4
+            out.append((item["id"], source, data))
+        except Exception as e:
+            out.append((item["id"], "error", str(e).encode("utf-8")))
+    return out, times
+
+# ==== LLM (اختياري) في العملية الرئيسية ====
+
+class LLMGate:
+    """تزامن محدود + معدل طلبات/ثانية لنداءات الـ LLM."""
+
+    def __init__(self, concurrency: int, rps: float):
+        self.sem = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rps, max(1.0, rps))
+        self.router = IntentRouter()
+        self.calls = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    async def _wait_turn(self) -> None:
+        while True:
+            delay = self.bucket.wait(time.monotonic())
+            if delay <= 0:
+                self.bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+    async def plan(self, item: Item) -> None:
+        from . import llm  # لا نحمّل عميل الـ LLM إلا مع --llm
+
+        prompt = item.get("prompt")
+        if not prompt or self.router.match(prompt) is not None:
+            return  # القوالب لا تحتاج LLM
+        async with self.sem:
+            await self._wait_turn()
+            t0 = time.perf_counter()
+            self.calls += 1
+            try:
+                plan = (await llm.plan_hedged(prompt)).plan
+                if not validate_plan(plan):
+                    item["plan"] = plan
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"[batch] LLM failed for {item['id']}: {e}")
+            finally:
+                self.seconds += time.perf_counter() - t0
+
+# ==== التشغيل ====
+
+class Writer:
+    def __init__(self, output: Optional[str], out_dir: Optional[str]):
+        self.out_dir = out_dir
+        self.sources: Counter = Counter()
+        self.bytes = 0
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            self.fh = None
+        elif output and output != "-":
+            self.fh = open(output, "wb")
+        else:
+            self.fh = sys.stdout.buffer
+
+    def write(self, results: List[Result]) -> None:
+        for item_id, source, data in results:
+            self.sources[source] += 1
+            if source == "error":
+                line = serde.dumps({"id": item_id, "error": data.decode("utf-8", "replace")}) + b"\n"
+                if self.out_dir:
+                    sys.stderr.buffer.write(line)
+                    continue
+            elif self.out_dir:
+                safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in item_id)
+                with open(os.path.join(self.out_dir, f"{safe}.json"), "wb") as f:
+                    f.write(data)
+                self.bytes += len(data)
+                continue
+            else:
+                # الـ workflow مسلسل مسبقًا: نلصقه كما هو داخل سطر الإخراج
+                line = b'{"id":' + serde.dumps(item_id) + b',"source":"' + source.encode() + b'","workflow":' + data + b"}\n"
+            self.fh.write(line)
+            self.bytes += len(line)
+
+    def close(self) -> None:
+        if self.fh is not None and self.fh is not sys.stdout.buffer:
+            self.fh.close()
+        elif self.fh is not None:
+            self.fh.flush()
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    gate = LLMGate(args.llm_concurrency, args.llm_rps) if args.llm else None
+    writer = Writer(args.output, args.out_dir)
+    times = dict.fromkeys(STAGES, 0.0)
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    t0 = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+
+        async def process(chunk: List[Item]) -> Tuple[List[Result], Dict[str, float]]:
+            if gate is not None:
+                await asyncio.gather(*(gate.plan(item) for item in chunk))
+            return await loop.run_in_executor(pool, compile_chunk, chunk)
+
+        def collect(done: Tuple[List[Result], Dict[str, float]]) -> None:
+            results, chunk_times = done
+            writer.write(results)
+            for k, v in chunk_times.items():
+                times[k] += v
+
+        # نافذة محدودة من الدفعات الجارية: الذاكرة لا تكبر مع حجم الملف، والإخراج بترتيب الإدخال
+        inflight: Deque[asyncio.Future] = deque()
+        try:
+            for chunk in _chunks(read_items(src), args.chunk):
+                inflight.append(asyncio.ensure_future(process(chunk)))
+                while len(inflight) >= args.workers * 2:
+                    collect(await inflight.popleft())
+            while inflight:
+                collect(await inflight.popleft())
+        finally:
+            if src is not sys.stdin:
+                src.close()
+            writer.close()
+            if gate is not None:
+                from . import net
+                await net.shutdown()
+
+    elapsed = time.perf_counter() - t0
+    total = sum(writer.sources.values())
+    summary: Dict[str, Any] = {
+        "items": total,
+        "seconds": round(elapsed, 3),
+        "items_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "sources": dict(writer.sources),
+        "bytes_out": writer.bytes,
+        "stage_us_avg": {k: round(v / total * 1e6, 1) if total else 0.0 for k, v in times.items()},
+    }
+    if gate is not None:
+        summary["llm"] = {"calls": gate.calls, "failed": gate.failed,
+                          "avg_s": round(gate.seconds / gate.calls, 3) if gate.calls else 0.0}
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.batch", description="Compile a JSONL of prompts into n8n workflows")
+    ap.add_argument("input", help="JSONL file of prompts, or - for stdin")
+    ap.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    ap.add_argument("--out-dir", help="write one <id>.json per prompt instead of JSONL")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=64, help="prompts per worker task")
+    ap.add_argument("--llm", action="store_true", help="ask the LLM for prompts no template matches")
+    ap.add_argument("--llm-concurrency", type=int, default=4)
+    ap.add_argument("--llm-rps", type=float, default=2.0)
+    args = ap.parse_args(argv)
+    if args.llm and not os.getenv("OPENROUTER_API_KEY"):
+        ap.error("--llm needs OPENROUTER_API_KEY")
+
+    logging.basicConfig(level=logging.WARNING)
+    summary = asyncio.run(run(args))
+    print(serde.dumps_str(summary), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
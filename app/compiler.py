@@ -0,0 +1,176 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from .layout import layout
+from .spec import Plan, Step
+
+# مترجم الخطة المجردة (Plan) إلى Workflow n8n.
+# لكل StepType مصنع عقدة واحد، يُسجَّل مرة عند الاستيراد ويُعاد استعماله لكل الخطط.
+
+TELEGRAM_CREDENTIALS = {"telegramApi": {"id": "TELEGRAM_CRED", "name": "Telegram Account"}}
+
+class CompileError(ValueError):
+    pass
+
+NodeFactory = Callable[[Step, str], Dict[str, Any]]  # (step, timezone) → عقدة بدون name/position
+FACTORIES: Dict[str, NodeFactory] = {}
+
+def factory(step_type: str) -> Callable[[NodeFactory], NodeFactory]:
+    def register(fn: NodeFactory) -> NodeFactory:
+        FACTORIES[step_type] = fn
+        return fn
+    return register
+
+def _node(step: Step, type_: str, version: int, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": step.id, "type": type_, "typeVersion": version, "parameters": parameters}
+
+def cron_expression(params: Dict[str, Any]) -> str:
+    """params: {cron: "..."} أو {hour, minute, weekday, day}؛ الافتراضي 09:00 يوميًا."""
+    expr = params.get("cron") or params.get("expression")
+    if expr:
+        return str(expr)
+    return "{} {} {} * {}".format(
+        params.get("minute", 0), params.get("hour", 9), params.get("day", "*"), params.get("weekday", "*")
+    )
+
+def describe_cron(expr: str) -> str:
+    """للعرض: "M H * * *" → HH:MM، وأي جدولة أخرى تُعرض كتعبير cron."""
+    parts = expr.split()
+    if len(parts) == 5 and parts[2:] == ["*", "*", "*"] and parts[0].isdigit() and parts[1].isdigit():
+        return f"{int(parts[1]):02d}:{int(parts[0]):02d}"
+    return expr
+
+@factory("cron")
+def _cron(step: Step, tz: str) -> Dict[str, Any]:
+    return _node(step, "n8n-nodes-base.cron", 1, {
+        "rule": {"interval": "custom", "customInterval": cron_expression(step.params)},
+        "timezone": step.params.get("timezone", tz),
+    })
+
+@factory("webhook")
+def _webhook(step: Step, tz: str) -> Dict[str, Any]:
+    node = _node(step, "n8n-nodes-base.webhook", 1, {
+        "path": step.params.get("path", step.id),
+        "httpMethod": step.params.get("httpMethod", step.params.get("method", "POST")),
+        "responseMode": step.params.get("responseMode", "onReceived"),
+    })
+    node["webhookId"] = step.params.get("webhookId", step.id)
+    return node
+
+@factory("http")
+def _http(step: Step, tz: str) -> Dict[str, Any]:
+    params = {"url": "https://httpbin.org/anything", "method": "GET", **step.params}
+    return _node(step, "n8n-nodes-base.httpRequest", 3, params)
+
+@factory("set")
+def _set(step: Step, tz: str) -> Dict[str, Any]:
+    params = {"keepOnlySet": True, **step.params}
+    params.setdefault("values", {"string": []})
+    return _node(step, "n8n-nodes-base.set", 2, params)
+
+@factory("if")
+def _if(step: Step, tz: str) -> Dict[str, Any]:
+    params = {k: v for k, v in step.params.items() if k not in ("then", "else", "expression")}
+    if "conditions" not in params:
+        # صيغة الـ LLM: {expression:'={{ ... }}'} → شرط boolean في n8n
+        expr = step.params.get("expression", "={{ true }}")
+        params["conditions"] = {"boolean": [{"value1": expr, "value2": True}]}
+    return _node(step, "n8n-nodes-base.if", 1, params)
+
+@factory("wait")
+def _wait(step: Step, tz: str) -> Dict[str, Any]:
+    return _node(step, "n8n-nodes-base.wait", 1, {
+        "amount": step.params.get("seconds", step.params.get("amount", 10)),
+        "unit": step.params.get("unit", "seconds"),
+    })
+
+@factory("telegram")
+def _telegram(step: Step, tz: str) -> Dict[str, Any]:
+    params = {k: v for k, v in step.params.items() if k != "message"}
+    params.setdefault("chatId", "={{$env.TELEGRAM_CHAT_ID}}")
+    params.setdefault("text", step.params.get("message", "={{$json.msg}}"))
+    node = _node(step, "n8n-nodes-base.telegram", 2, params)
+    node["credentials"] = TELEGRAM_CREDENTIALS
+    return node
+
+DISPLAY_NAMES = {"cron": "Cron", "webhook": "Webhook", "http": "HTTP Request", "set": "Set",
+                 "if": "IF", "wait": "Wait", "telegram": "Telegram"}
+TRIGGER_TYPES = frozenset(("cron", "webhook"))
+MANUAL_TRIGGER_ID = "manual_trigger"
+
+def _output_index(step: Step, target: str) -> int:
+    """فرع then → المخرج 0، فرع else → المخرج 1."""
+    if step.type == "if" and step.params.get("else") == target and step.params.get("then") != target:
+        return 1
+    return 0
+
+def compile_plan(plan: Union[Plan, Dict[str, Any]], name: Optional[str] = None) -> Dict[str, Any]:
+    """Plan → dict بصيغة N8nWorkflow (جاهز لـ json.dumps والاستيراد في n8n)."""
+    if not isinstance(plan, Plan):
+        plan = Plan.model_validate(plan)
+    tz = plan.timezone or "UTC"
+
+    nodes: List[Dict[str, Any]] = []
+    by_id: Dict[str, Dict[str, Any]] = {}
+    steps: Dict[str, Step] = {}
+    used_names: set = set()
+    for step in plan.steps:
+        make = FACTORIES.get(step.type)
+        if make is None:
+            raise CompileError(f"no node factory for step type '{step.type}'")
+        node = make(step, tz)
+        nm = step.name or DISPLAY_NAMES[step.type]
+        if nm in used_names:
+            nm = f"{nm} ({step.id})"
+        used_names.add(nm)
+        node["name"] = nm
+        nodes.append(node)
+        by_id[step.id] = node
+        steps[step.id] = step
+
+    # الحواف: from/to + فروع if المعرّفة في params (then/else) حتى لو لم تُذكر كحافة
+    links: List[tuple] = [(e.from_, e.to) for e in plan.edges]
+    for step in plan.steps:
+        if step.type == "if":
+            links += [(step.id, step.params[k]) for k in ("then", "else") if step.params.get(k)]
+
+    if not any(s.type in TRIGGER_TYPES for s in plan.steps) and plan.steps:
+        # n8n يحتاج trigger: نضيف Manual Trigger يغذي كل الجذور
+        has_incoming = {to for _, to in links}
+        trigger = {"id": MANUAL_TRIGGER_ID, "name": "Manual Trigger", "type": "n8n-nodes-base.manualTrigger",
+                   "typeVersion": 1, "parameters": {}}
+        nodes.insert(0, trigger)
+        by_id[MANUAL_TRIGGER_ID] = trigger
+        links = [(MANUAL_TRIGGER_ID, s.id) for s in plan.steps if s.id not in has_incoming] + links
+
+    connections: Dict[str, Dict[str, List[List[Dict[str, Any]]]]] = {}
+    seen: set = set()
+    placed: List[tuple] = []
+    for src, dst in links:
+        if (src, dst) in seen:
+            continue
+        seen.add((src, dst))
+        a, b = by_id.get(src), by_id.get(dst)
+        if a is None or b is None:
+            raise CompileError(f"edge {src} → {dst} references an unknown step")
+        step = steps.get(src)
+        idx = _output_index(step, dst) if step is not None else 0
+        outputs = connections.setdefault(a["name"], {"main": []})["main"]
+        while len(outputs) <= idx:
+            outputs.append([])
+        outputs[idx].append({"node": b["name"], "type": "main", "index": 0})
+        placed.append((src, dst, idx))
+
+    positions = layout([n["id"] for n in nodes], placed)
+    for n in nodes:
+        n["position"] = positions[n["id"]]
+
+    return {
+        "name": name or plan.name,
+        "nodes": nodes,
+        "connections": connections,
+        "settings": {"timezone": tz},
+    }
+
+def compile_many(plans: Iterable[Union[Plan, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [compile_plan(p) for p in plans]
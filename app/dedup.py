@@ -0,0 +1,67 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional
+
+from . import state
+
+# Telegram يعيد إرسال نفس التحديث إذا تأخر الـ webhook؛ نتجاهل التكرار قبل جدولة أي عمل.
+# مع STATE_BACKEND مشترك (sqlite/redis) يرى كل العمال نفس المفاتيح: تحديث واحد = عامل واحد.
+DEDUP_MAX = int(os.getenv("DEDUP_MAX", "10000"))
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "3600"))
+
+_EDITED = ("edited_message", "edited_channel_post")
+
+def update_keys(payload: Dict[str, Any]) -> List[str]:
+    """مفاتيح التحديث: update_id، ولرسائل التعديل أيضًا chat_id+message_id."""
+    keys: List[str] = []
+    if payload.get("update_id") is not None:
+        keys.append(f"dedup:u:{payload['update_id']}")
+    for k in _EDITED:
+        msg = payload.get(k)
+        if isinstance(msg, dict):
+            chat_id = (msg.get("chat") or {}).get("id")
+            if chat_id is not None and msg.get("message_id") is not None:
+                keys.append(f"dedup:e:{chat_id}:{msg['message_id']}")
+    return keys
+
+class UpdateDeduper:
+    def __init__(self, maxsize: int = DEDUP_MAX, ttl: float = DEDUP_TTL,
+                 backend: Optional[state.StateBackend] = None):
+        if backend is None:
+            shared = state.get_backend()
+            backend = shared if shared.shared else state.MemoryBackend(maxsize)
+        self.backend = backend
+        # إذا تعطل الـ backend المشترك نكمل بالذاكرة المحلية: تكرار نادر بين العمال أهون من فقدان تحديث
+        self.local = state.MemoryBackend(maxsize) if backend.shared else backend
+        self.ttl = ttl
+        self.hits = 0    # تحديثات مكررة تم تجاهلها
+        self.misses = 0  # تحديثات جديدة
+        self.fallbacks = 0  # فحوص تمت محليًا لأن الـ backend غير متاح
+
+    async def seen(self, payload: Dict[str, Any]) -> bool:
+        """True إذا التحديث مكرر؛ وإلا يسجّله ويعيد False."""
+        keys = update_keys(payload)
+        if not keys:
+            self.misses += 1
+            return False
+        # فحص + تسجيل كل المفاتيح في رحلة واحدة (SET NX)؛ مفتاح موجود مسبقًا = تكرار
+        try:
+            added = await state.run(self.backend, "add_many", keys, self.ttl)
+        except state.BACKEND_ERRORS:
+            self.fallbacks += 1
+            added = self.local.add_many(keys, self.ttl)
+        if not all(added):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "fallbacks": self.fallbacks,
+            **self.backend.stats(),
+        }
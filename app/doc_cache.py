@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os, asyncio, hashlib, sqlite3, logging
+from typing import Any, Dict, Optional, Union
+
+from . import state
+from .cache import SqliteStore, TTLCache
+
+# كاش مستندات حسب المحتوى: sha256(workflow.json) → file_id الذي أعاده Telegram،
+# فالنسخ المطابقة تُرسل بـ file_id بدون رفع الملف من جديد.
+logger = logging.getLogger("app.doc_cache")
+
+DOC_CACHE_MAX = int(os.getenv("DOC_CACHE_MAX", "5000"))
+DOC_CACHE_PATH = os.getenv("DOC_CACHE_PATH", "")  # فارغ = ذاكرة فقط (أو STATE_BACKEND إن كان مشتركًا)
+
+class DocumentCache:
+    def __init__(self, maxsize: int = DOC_CACHE_MAX, path: str = DOC_CACHE_PATH):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.disk: Optional[Union[SqliteStore, state.SharedStore]] = None
+        if path:
+            try:
+                self.disk = SqliteStore(path, "documents", max_rows=maxsize * 4)
+            except sqlite3.Error as e:
+                logger.warning(f"[doc_cache] persistence disabled ({path}): {e}")
+        else:
+            self.disk = state.shared_store("doc")
+        self.reused = 0
+        self.uploaded = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    async def _disk(self, method: str, *args: Any) -> Any:
+        """الطبقة الثانية في thread؛ خطأ = miss (نرفع الملف من جديد) بدل فشل الإرسال."""
+        try:
+            return await asyncio.to_thread(getattr(self.disk, method), *args)
+        except state.BACKEND_ERRORS as e:
+            logger.warning(f"[doc_cache] disk tier {method} failed: {e}")
+            return None
+
+    async def get(self, key: str) -> Optional[str]:
+        file_id = self.memory.get(key)
+        if file_id is None and self.disk is not None:
+            file_id = await self._disk("get", key)
+            if file_id is not None:
+                self.memory.set(key, file_id)
+        return file_id
+
+    async def put(self, key: str, file_id: str) -> None:
+        self.memory.set(key, file_id)
+        if self.disk is not None:
+            await self._disk("set", key, file_id)
+
+    async def drop(self, key: str) -> None:
+        """file_id لم يعد صالحًا (Telegram رفضه) → نرفع من جديد في المرة القادمة."""
+        self.memory.pop(key)
+        if self.disk is not None:
+            await self._disk("delete", key)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.reused + self.uploaded
+        return {
+            "reused": self.reused,
+            "uploaded": self.uploaded,
+            "reuse_rate": round(self.reused / total, 4) if total else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "size": len(self.memory),
+            "persistent": bool(self.disk),
+            "shared": isinstance(self.disk, state.SharedStore),
+        }
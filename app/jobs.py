@@ -0,0 +1,103 @@
+from __future__ import annotations
+import os, asyncio, logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+# مُجدول مهام خلفية محدود: عدد ثابت من العمال، طابور محدود، ومهمة واحدة لكل محادثة في نفس الوقت.
+logger = logging.getLogger("app.jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "200"))
+JOB_PER_CHAT_MAX = int(os.getenv("JOB_PER_CHAT_MAX", "3"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "25"))
+
+JobFn = Callable[..., Awaitable[Any]]
+Job = Tuple[JobFn, tuple]
+
+class JobScheduler:
+    """
+    submit() لا يحجب أبدًا: يعيد False إذا الطابور ممتلئ (نرد على المستخدم "مشغول").
+    المهام لنفس المفتاح (chat_id) تُنفّذ بالترتيب وواحدة تلو الأخرى.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_MAX,
+                 per_key_max: int = JOB_PER_CHAT_MAX):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_key_max = per_key_max
+        self._ready: Optional[asyncio.Queue] = None
+        self._pending: Dict[Hashable, Deque[Job]] = {}  # مفتاح نشط → مهامه المنتظرة
+        self._tasks: List[asyncio.Task] = []
+        self._depth = 0  # كل المهام المقبولة وغير المنتهية
+        self._closing = False
+        self._idle: Optional[asyncio.Event] = None
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def submit(self, key: Hashable, fn: JobFn, *args: Any) -> bool:
+        if self._ready is None or self._closing:
+            return False
+        if self._depth >= self.max_queue:
+            return False
+        waiting = self._pending.get(key)
+        if waiting is not None:
+            if len(waiting) >= self.per_key_max:
+                return False
+            waiting.append((fn, args))
+        else:
+            self._pending[key] = deque()
+            self._ready.put_nowait((key, fn, args))
+        self._depth += 1
+        self._idle.clear()
+        return True
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key, fn, args = await self._ready.get()
+            try:
+                await fn(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[jobs] worker {n} job failed: {e}")
+            finally:
+                self._done(key)
+
+    def _done(self, key: Hashable) -> None:
+        self._depth -= 1
+        waiting = self._pending.get(key)
+        if waiting:
+            fn, args = waiting.popleft()
+            self._ready.put_nowait((key, fn, args))
+        else:
+            self._pending.pop(key, None)
+        if self._depth == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float = JOB_DRAIN_TIMEOUT) -> None:
+        """إيقاف القبول، انتظار المهام الجارية حتى timeout، ثم إلغاء العمال."""
+        if not self._tasks:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[jobs] drain timeout, dropping {self._depth} job(s)")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        self._depth = 0
+        self._ready = None
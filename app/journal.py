@@ -0,0 +1,258 @@
+from __future__ import annotations
+import os, time, socket, asyncio, sqlite3, logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import serde
+
+# سجل مهام (write-ahead journal) يبقى بعد إعادة التشغيل: كل طلب مقبول يُسجَّل قبل الرد على Telegram،
+# وكل مرحلة تكتمل تُضاف كسطر جديد (append-only). عند البدء تُستأنف المهام غير المنتهية من آخر مرحلة،
+# فخطة الـ LLM المحفوظة لا تُطلب مرة ثانية.
+# الكتابة بالتجميع (group commit): الأسطر تتجمع JOURNAL_FLUSH_MS ثم transaction واحدة + fsync واحد في thread.
+# كل عملية تكتب heartbeat في جدول owners؛ مالك بلا heartbeat حديث (أو عملية منتهية على نفس النسخة) يُعتبر ميتًا،
+# فالمهام تُستأنف حتى لو تغيّر اسم الجهاز بعد إعادة نشر الحاوية.
+logger = logging.getLogger("app.journal")
+
+JOB_JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "")  # فارغ = معطل
+JOURNAL_FLUSH_MS = float(os.getenv("JOURNAL_FLUSH_MS", "5"))
+JOURNAL_MAX_AGE = float(os.getenv("JOURNAL_MAX_AGE", str(6 * 3600)))  # طلب أقدم من هذا لا يُستأنف
+JOURNAL_MAX_RESUMES = int(os.getenv("JOURNAL_MAX_RESUMES", "3"))     # مهمة تُسقط العملية كل مرة
+JOURNAL_INSTANCE = os.getenv("JOURNAL_INSTANCE", "") or socket.gethostname()  # ثابت لكل نسخة (اسم الخدمة/الـ slot)
+JOURNAL_HEARTBEAT = float(os.getenv("JOURNAL_HEARTBEAT", "10"))
+JOURNAL_OWNER_TTL = float(os.getenv("JOURNAL_OWNER_TTL", str(JOURNAL_HEARTBEAT * 6)))  # بعدها المالك الصامت ميت
+
+# المراحل بالترتيب
+ACCEPTED = "accepted"  # {"chat_id", "text", "update_id"}
+RESUMED = "resumed"    # عملية جديدة أخذت المهمة
+PLANNED = "planned"    # {"plan"}: خطة جاهزة (من الـ LLM غالبًا)
+DONE = "done"          # {"outcome"}: نهاية المهمة (أُرسلت، أو فشلت نهائيًا، expired/abandoned/corrupt)
+
+Row = Tuple[str, str, str, Optional[str], float]  # (job, stage, owner, data, ts)
+
+class PendingJob:
+    __slots__ = ("job_id", "chat_id", "text", "update_id", "plan", "resumes", "accepted_at")
+
+    def __init__(self, job_id: str, chat_id: int, text: str, update_id: Optional[int], accepted_at: float):
+        self.job_id = job_id
+        self.chat_id = chat_id
+        self.text = text
+        self.update_id = update_id
+        self.plan: Optional[Dict[str, Any]] = None
+        self.resumes = 0
+        self.accepted_at = accepted_at
+
+class JobJournal:
+    def __init__(self, path: str = JOB_JOURNAL_PATH, flush_ms: float = JOURNAL_FLUSH_MS,
+                 instance: str = JOURNAL_INSTANCE):
+        self.path = path
+        self.flush_interval = flush_ms / 1000
+        self.instance = instance
+        # pid وحده لا يكفي: داخل الحاويات نفس الـ pid يتكرر بعد إعادة التشغيل
+        self.owner = f"{instance}:{os.getpid()}:{time.time():.6f}"
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            try:
+                self._db = self._open(path)
+            except sqlite3.Error as e:
+                logger.warning(f"[journal] disabled ({path}): {e}")
+        self._buffer: List[Row] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushing = False
+        self._closing = False
+        self.rows = 0
+        self.flushes = 0
+        self.resumed = 0
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL")  # fsync عند كل commit؛ التجميع يجعله fsync لكل دفعة
+        db.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL, "
+                   "stage TEXT NOT NULL, owner TEXT NOT NULL, data TEXT, ts REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS events_job ON events (job)")
+        db.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, seen REAL NOT NULL)")
+        return db
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    # ==== الكتابة ====
+
+    def start(self) -> None:
+        if self._db is not None and self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, job_id: Optional[str], stage: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """يضيف سطرًا للدفعة التالية (بدون انتظار)؛ commit() ينتظر وصوله للقرص."""
+        if self._db is None or job_id is None:
+            return
+        self._buffer.append((job_id, stage, self.owner, None if data is None else serde.dumps_str(data), time.time()))
+        if self._wake is not None:
+            self._wake.set()
+
+    async def commit(self) -> None:
+        """ينتظر حتى تُكتب كل الأسطر المسجلة حتى الآن (مع أسطر الطلبات المتزامنة في نفس الـ fsync)."""
+        if self._task is None or not (self._buffer or self._flushing):
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._wake.set()
+        await fut
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                # بدون أسطر جديدة نستيقظ كل JOURNAL_HEARTBEAT لتجديد الـ heartbeat فقط
+                await asyncio.wait_for(self._wake.wait(), JOURNAL_HEARTBEAT)
+            except TimeoutError:
+                pass
+            if self._buffer and not self._closing:
+                await asyncio.sleep(self.flush_interval)  # نافذة التجميع
+            self._wake.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        rows, self._buffer = self._buffer, []
+        waiters, self._waiters = self._waiters, []
+        self._flushing = True
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            logger.error(f"[journal] write failed, {len(rows)} row(s) lost: {e}")
+        finally:
+            self._flushing = False
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)  # لا نحجب الرد على Telegram بسبب خطأ في السجل
+
+    def _write(self, rows: List[Row]) -> None:
+        """الأسطر + heartbeat هذه العملية في نفس الـ transaction (دفعة فارغة = heartbeat فقط)."""
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("INSERT INTO events (job, stage, owner, data, ts) VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, time.time()))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        if rows:
+            self.rows += len(rows)
+            self.flushes += 1
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task  # آخر دفعة (مراحل انتهت أثناء الإيقاف)
+            self._task = None
+            if self._buffer:
+                await self._flush()
+        if self._db is not None:
+            try:
+                # إيقاف منظم: المهام غير المنتهية تصبح قابلة للاستئناف فورًا من نسخة أخرى
+                self._db.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+            except sqlite3.Error:
+                pass
+            self._db.close()
+            self._db = None
+
+    # ==== الاستئناف ====
+
+    def _dead(self, owner: str, beats: Dict[str, float], now: float) -> bool:
+        """المالك عملية انتهت؟ عملية منتهية على نفس النسخة (نعرف فورًا)، أو بلا heartbeat منذ JOURNAL_OWNER_TTL."""
+        if owner == self.owner:
+            return False
+        instance, pid, _ = (owner.rsplit(":", 2) + ["", ""])[:3]
+        if instance == self.instance:
+            try:
+                if int(pid) == os.getpid():
+                    return True  # نفس الـ pid لكن تشغيل سابق
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except (ValueError, OSError):
+                pass
+        seen = beats.get(owner)
+        return seen is None or now - seen > JOURNAL_OWNER_TTL
+
+    def _claim(self) -> List[PendingJob]:
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")  # عمال يبدؤون معًا لا يأخذون نفس المهمة
+        try:
+            # ضغط السجل: المهام المنتهية لم تعد مهمة
+            self._db.execute("DELETE FROM events WHERE job IN (SELECT job FROM events WHERE stage = ?)", (DONE,))
+            self._db.execute("DELETE FROM owners WHERE seen < ?", (now - JOURNAL_MAX_AGE,))
+            beats: Dict[str, float] = dict(self._db.execute("SELECT owner, seen FROM owners"))
+            jobs: Dict[str, PendingJob] = {}
+            owners: Dict[str, str] = {}
+            corrupt: Dict[str, str] = {}  # سطر لا يُقرأ (تغيّر المخطط بين نشرين مثلًا) → المهمة تُترك
+            for job, stage, owner, data, ts in self._db.execute(
+                    "SELECT job, stage, owner, data, ts FROM events ORDER BY seq"):
+                owners[job] = owner
+                try:
+                    if stage == ACCEPTED:
+                        d = serde.loads(data)
+                        jobs[job] = PendingJob(job, int(d["chat_id"]), str(d["text"]), d.get("update_id"), ts)
+                    elif job not in jobs:
+                        continue
+                    elif stage == PLANNED:
+                        jobs[job].plan = serde.loads(data)["plan"]
+                    elif stage == RESUMED:
+                        jobs[job].resumes += 1
+                except (ValueError, TypeError, KeyError) as e:
+                    corrupt.setdefault(job, f"{stage}: {e!r}")
+            claimed: List[PendingJob] = []
+            finished: List[Row] = []
+
+            def done(job_id: str, outcome: str) -> None:
+                finished.append((job_id, DONE, self.owner, serde.dumps_str({"outcome": outcome}), now))
+
+            for job_id in corrupt:
+                jobs.pop(job_id, None)
+                done(job_id, "corrupt")
+            for job in jobs.values():
+                # العمر أولًا: مهمة قديمة تُترك حتى لو بدا مالكها حيًا
+                if now - job.accepted_at > JOURNAL_MAX_AGE:
+                    done(job.job_id, "expired")
+                elif not self._dead(owners[job.job_id], beats, now):
+                    continue  # عملية حية ما زالت تعمل عليها
+                elif job.resumes >= JOURNAL_MAX_RESUMES:
+                    done(job.job_id, "abandoned")
+                else:
+                    finished.append((job.job_id, RESUMED, self.owner, None, now))
+                    claimed.append(job)
+            self._db.executemany("INSERT INTO events (job, stage, owner, data, ts) VALUES (?, ?, ?, ?, ?)", finished)
+            self._db.execute("INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, now))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        for row in finished:
+            if row[1] == DONE:
+                reason = corrupt.get(row[0], "")
+                logger.warning(f"[journal] job {row[0]} dropped: {serde.loads(row[3])['outcome']} {reason}".rstrip())
+        self.resumed += len(claimed)
+        return claimed
+
+    async def recover(self) -> List[PendingJob]:
+        """المهام غير المنتهية لعمليات سابقة، بعد تسجيلها باسم هذه العملية."""
+        if self._db is None:
+            return []
+        try:
+            return await asyncio.to_thread(self._claim)
+        except sqlite3.Error as e:
+            logger.error(f"[journal] recovery failed: {e}")
+            return []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "rows": self.rows,
+            "flushes": self.flushes,
+            "rows_per_flush": round(self.rows / self.flushes, 2) if self.flushes else 0.0,
+            "resumed": self.resumed,
+        }
@@ -0,0 +1,171 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+# توزيع العقد على كانفس n8n بطريقة الطبقات (Sugiyama):
+# 1) ترتيب طبقات بأطول مسار من الجذور  2) عقد وهمية للحواف الطويلة
+# 3) تقليل التقاطعات بـ barycenter مع الاحتفاظ بأفضل ترتيب  4) تثبيت على الشبكة.
+# كل مرحلة خطية تقريبًا (O(V+E) + فرز/عدّ O(E log V)) لتبقى آلاف العقد بالميلي ثانية.
+
+X_STEP = 260  # مسافة أفقية بين الطبقات
+Y_STEP = 160  # مسافة عمودية بين العقد في نفس الطبقة
+ORIGIN = (0, 300)
+GRID = 20  # شبكة n8n
+SWEEPS = 4
+MAX_SPAN = 8  # حافة أطول من هذا لا تأخذ عقدًا وهمية (تبقى العقد الوهمية O(E))
+
+Link = Tuple[str, str, int]  # (من, إلى, رقم المخرج: 0 = then، 1 = else)
+Layers = List[List[Hashable]]
+Adjacency = Dict[Hashable, List[Tuple[Hashable, int]]]
+
+def _snap(v: float) -> int:
+    return int(round(v / GRID)) * GRID
+
+def rank_nodes(nodes: Sequence[str], links: Iterable[Link]) -> Tuple[Dict[str, int], List[Link]]:
+    """طبقة كل عقدة = أطول مسار من جذر. الحلقات تُكسر، والحواف الراجعة لا تدخل في الترتيب."""
+    succ: Dict[str, List[Link]] = {n: [] for n in nodes}
+    indeg: Dict[str, int] = dict.fromkeys(nodes, 0)
+    kept: List[Link] = []
+    for link in links:
+        a, b, _ = link
+        if a in succ and b in succ and a != b:
+            succ[a].append(link)
+            indeg[b] += 1
+            kept.append(link)
+
+    rank: Dict[str, int] = {}
+    queue = [n for n in nodes if indeg[n] == 0]
+    head = 0
+    while True:
+        while head < len(queue):
+            n = queue[head]
+            head += 1
+            r = rank.setdefault(n, 0)
+            for _, b, _ in succ[n]:
+                if indeg[b] > 0:  # العقد المعالجة سابقًا (حلقة) لا تُعاد طبقتها
+                    if rank.get(b, -1) <= r:
+                        rank[b] = r + 1
+                    indeg[b] -= 1
+                    if indeg[b] == 0:
+                        queue.append(b)
+        if head >= len(nodes):
+            break
+        # حلقة: نكسرها عند أول عقدة لم تُعالج بعد
+        stuck = next(n for n in nodes if indeg[n] > 0)
+        indeg[stuck] = 0
+        rank.setdefault(stuck, 0)
+        queue.append(stuck)
+
+    forward = [l for l in kept if rank[l[1]] > rank[l[0]]]
+    # ضغط: عقدة بلا آباء بعيدين تُسحب لتكون مباشرة قبل أقرب أبنائها (حواف أقصر، عقد وهمية أقل)
+    nearest: Dict[str, List[str]] = {}
+    for a, b, _ in forward:
+        nearest.setdefault(a, []).append(b)
+    for n in reversed(queue):
+        children = nearest.get(n)
+        if children:
+            r = min(rank[b] for b in children) - 1
+            if r > rank[n]:
+                rank[n] = r
+    return rank, forward
+
+def _proper_graph(nodes: Sequence[str], rank: Dict[str, int], links: List[Link]) -> Tuple[Layers, Adjacency, Adjacency]:
+    """طبقات + مجاورة بين طبقات متتالية فقط؛ الحافة الطويلة تمر بعقد وهمية (tuples)."""
+    layers: Layers = [[] for _ in range(max(rank.values()) + 1)]
+    for n in nodes:  # ترتيب أولي: ترتيب ظهور الخطوات في الخطة
+        layers[rank[n]].append(n)
+    down: Adjacency = {n: [] for n in nodes}
+    up: Adjacency = {n: [] for n in nodes}
+    for a, b, k in links:
+        if rank[b] - rank[a] > MAX_SPAN:
+            continue  # تُرسم مباشرة ولا تدخل في تقليل التقاطعات
+        prev: Hashable = a
+        for r in range(rank[a] + 1, rank[b]):
+            dummy = (a, b, k, r)
+            layers[r].append(dummy)
+            down[dummy], up[dummy] = [], []
+            down[prev].append((dummy, k))
+            up[dummy].append((prev, k))
+            prev = dummy
+        down[prev].append((b, k))
+        up[b].append((prev, k))
+    return layers, down, up
+
+def _place(layer: List[Hashable], index: Dict[Hashable, float]) -> None:
+    # موضع نسبي حول المركز، متوافق مع الإحداثيات النهائية
+    mid = (len(layer) - 1) / 2
+    for i, n in enumerate(layer):
+        index[n] = i - mid
+
+def _sweep(layers: Layers, index: Dict[Hashable, float], neighbours: Adjacency, reverse: bool) -> None:
+    order = range(len(layers) - 1, -1, -1) if reverse else range(len(layers))
+    for li in order:
+        layer = layers[li]
+        if len(layer) < 2:
+            continue
+        keys: Dict[Hashable, float] = {}
+        for n in layer:
+            nb = neighbours[n]
+            if nb:
+                # مخرج else ينزل قليلًا تحت then لنفس الأب
+                keys[n] = sum(index[m] + k * 1e-3 for m, k in nb) / len(nb)
+            else:
+                keys[n] = index[n]
+        layer.sort(key=keys.__getitem__)
+        _place(layer, index)
+
+def count_crossings(layers: Layers, down: Adjacency) -> int:
+    """تقاطعات الحواف بين كل طبقتين متتاليتين: عدّ انعكاسات بشجرة Fenwick، O(E log V)."""
+    total = 0
+    for li in range(len(layers) - 1):
+        lower = layers[li + 1]
+        if len(lower) < 2:
+            continue
+        pos = {n: i for i, n in enumerate(lower)}
+        seq = [p for n in layers[li] for p in sorted(pos[m] for m, _ in down[n])]
+        size = len(lower)
+        tree = [0] * (size + 1)
+        for seen, p in enumerate(seq):
+            # الحواف السابقة التي تنتهي بعد p تتقاطع مع هذه الحافة
+            i, le = p + 1, 0
+            while i > 0:
+                le += tree[i]
+                i -= i & -i
+            total += seen - le
+            i = p + 1
+            while i <= size:
+                tree[i] += 1
+                i += i & -i
+    return total
+
+def order_layers(nodes: Sequence[str], links: Iterable[Link], sweeps: int = SWEEPS) -> Tuple[Layers, Adjacency]:
+    """الطبقات (مع العقد الوهمية) بأقل تقاطعات وُجدت خلال sweeps جولة barycenter."""
+    rank, forward = rank_nodes(nodes, links)
+    layers, down, up = _proper_graph(nodes, rank, forward)
+    index: Dict[Hashable, float] = {}
+    for layer in layers:
+        _place(layer, index)
+
+    best, best_layers = count_crossings(layers, down), [list(l) for l in layers]
+    for k in range(sweeps):
+        if best == 0:
+            break
+        # جولة نزولًا حسب الآباء ثم صعودًا حسب الأبناء
+        _sweep(layers, index, up if k % 2 == 0 else down, reverse=k % 2 == 1)
+        crossings = count_crossings(layers, down)
+        if crossings < best:
+            best, best_layers = crossings, [list(l) for l in layers]
+    return best_layers, down
+
+def layout(nodes: Sequence[str], links: Iterable[Link]) -> Dict[str, List[int]]:
+    """يرجع {id: [x, y]} مثبتة على شبكة n8n."""
+    if not nodes:
+        return {}
+    layers, _ = order_layers(nodes, links)
+    x0, y0 = ORIGIN
+    positions: Dict[str, List[int]] = {}
+    for li, layer in enumerate(layers):
+        top = y0 - (len(layer) - 1) * Y_STEP / 2
+        for i, n in enumerate(layer):
+            if not isinstance(n, tuple):
+                positions[n] = [_snap(x0 + li * X_STEP), _snap(top + i * Y_STEP)]
+    return positions
@@ -1,7 +1,23 @@
 from __future__ import annotations
-import os, httpx, json
+import os, httpx, time, asyncio, hashlib, logging
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from . import metrics, net, serde
+from .plan_cache import PlanCache
+from .validators import LLMEnvelope, PlanError, PlanStreamParser, coerce_json
+
+logger = logging.getLogger("app.llm")
 
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openrouter/auto")  # يختار موديل مناسب
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# hedging: موديلات بديلة تُطلق إذا تأخر الأول أكثر من LLM_HEDGE_DELAY ("auto" = p95 للموديل الأول)
+OPENROUTER_HEDGE_MODELS = [m.strip() for m in os.getenv("OPENROUTER_HEDGE_MODELS", "").split(",") if m.strip()]
+LLM_HEDGE_DELAY = os.getenv("LLM_HEDGE_DELAY", "8")
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+LLM_USAGE_GRACE = float(os.getenv("LLM_USAGE_GRACE", "10"))  # أقصى قراءة للـ usage في الخلفية بعد اكتمال الخطة
 
 SYSTEM = (
 "أنت مخطط أتمتة عام. حوّل وصف المستخدم إلى خطة JSON مُقيّدة."
@@ -27,14 +43,16 @@ SYSTEM = (
 "- لا تستخدم مفاتيح حقيقية؛ استخدم متغيرات بيئة مثل {{$env.MY_KEY}} إذا لزم.\n"
 )
 
-def call_openrouter(prompt: str) -> str:
-    if not OPENROUTER_API_KEY:
-        raise RuntimeError("OPENROUTER_API_KEY is missing")
-    model = "openrouter/auto"  # يختار موديل مناسب
-    headers = {
+# الكاش مرتبط بنص الـ SYSTEM: أي تعديل عليه يبطل الخطط القديمة تلقائيًا
+plan_cache = PlanCache(namespace=hashlib.sha1(SYSTEM.encode("utf-8")).hexdigest()[:12])
+
+def _headers() -> Dict[str, str]:
+    return {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
     }
+
+def _payload(prompt: str, model: str, stream: bool = False) -> Dict[str, Any]:
     payload = {
         "model": model,
         "messages": [
@@ -43,8 +61,216 @@ def call_openrouter(prompt: str) -> str:
         ],
         "temperature": 0.2,
     }
-    with httpx.Client(timeout=60) as client:
-        r = client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, data=json.dumps(payload))
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}  # عدد التوكنات يصل في آخر chunk
+    return payload
+
+def _sse_chunk(line: str) -> Optional[Dict[str, Any]]:
+    """سطر SSE من OpenRouter → الـ chunk (أو None لأسطر التعليق/النهاية)."""
+    if not line.startswith("data:"):
+        return None  # ": OPENROUTER PROCESSING" وأسطر فارغة
+    data = line[5:].strip()
+    if not data or data == "[DONE]":
+        return None
+    chunk = serde.loads(data)
+    if "error" in chunk:
+        raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+    return chunk
+
+def _sse_delta(chunk: Dict[str, Any]) -> Optional[str]:
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
+
+def _record_usage(model: str, usage: Optional[Dict[str, Any]]) -> bool:
+    if not isinstance(usage, dict):
+        return False
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            metrics.LLM_TOKENS.inc(model, kind.split("_")[0], n=usage[kind])
+    return True
+
+_drains: set = set()  # مهام قراءة usage في الخلفية (مرجع حتى لا تُجمع قبل انتهائها)
+
+async def _drain_usage(r: httpx.Response, lines: AsyncIterator[str], model: str) -> None:
+    """بقية الرد بعد الخطة (شرح زائد ثم usage) في الخلفية، حتى LLM_USAGE_GRACE ثانية، ثم يغلق الاتصال."""
+    try:
+        async with asyncio.timeout(LLM_USAGE_GRACE):
+            async for line in lines:
+                chunk = _sse_chunk(line)
+                if chunk is not None and _record_usage(model, chunk.get("usage")):
+                    return
+    except (TimeoutError, RuntimeError, ValueError, httpx.HTTPError):
+        pass  # الخطة وصلت؛ فقدان عدد التوكنات لا يفشل الطلب
+    finally:
+        await r.aclose()
+
+def _feed(parser: PlanStreamParser, delta: str) -> Tuple[PlanStreamParser, Optional[Dict[str, Any]]]:
+    """
+    يغذي المحلل؛ قوس داخل نص ("{example}") أو كائن بلا plan → محلل جديد من الـ { التالي
+    (نفس منطق coerce_json لكن تدريجيًا)، فتبقى الخطة اللاحقة توقف القراءة لحظة إغلاقها.
+    """
+    while True:
+        try:
+            result = parser.feed(delta)
+        except ValueError:
+            pass
+        else:
+            if result is None or "plan" in result:
+                return parser, result
+        parser, delta = parser.restart(), ""
+
+async def _stream_plan(prompt: str, model: str) -> Dict[str, Any]:
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError("OPENROUTER_API_KEY is missing")
+    parser = PlanStreamParser()
+    result = None
+    client = net.get_async_client()
+    request = client.build_request("POST", OPENROUTER_URL, headers=_headers(),
+                                   content=serde.dumps(_payload(prompt, model, stream=True)), timeout=LLM_TIMEOUT)
+    r = await client.send(request, stream=True)
+    handed_off = False
+    try:
         r.raise_for_status()
-        data = r.json()
-        return data["choices"][0]["message"]["content"]
+        lines = r.aiter_lines()
+        async for line in lines:
+            chunk = _sse_chunk(line)
+            if chunk is None:
+                continue
+            _record_usage(model, chunk.get("usage"))
+            delta = _sse_delta(chunk)
+            if delta:
+                parser, result = _feed(parser, delta)
+                if result is not None:
+                    # الخطة جاهزة: نرجعها فورًا، وchunk الـ usage (بعد الشرح الزائد) يُقرأ في الخلفية
+                    task = asyncio.create_task(_drain_usage(r, lines, model))
+                    _drains.add(task)
+                    task.add_done_callback(_drains.discard)
+                    handed_off = True
+                    break
+    finally:
+        if not handed_off:
+            await r.aclose()
+    if result is None:
+        result = coerce_json(parser.text)
+    LLMEnvelope(**result)
+    return result
+
+# ==== hedged requests ====
+
+class LatencyStats:
+    """آخر N زمن استجابة ناجح لكل موديل → p50/p95/p99 لضبط LLM_HEDGE_DELAY من بيانات حقيقية."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, seconds: Optional[float], outcome: str = "ok") -> None:
+        counts = self._counts.setdefault(model, {"ok": 0, "error": 0, "cancelled": 0})
+        counts[outcome] += 1
+        if seconds is not None:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for model, counts in self._counts.items():
+            out[model] = {
+                **counts,
+                **{f"p{int(q * 100)}": self.percentile(model, q) for q in (0.5, 0.95, 0.99)},
+            }
+        return out
+
+latency = LatencyStats()
+
+def hedge_delay(model: str) -> float:
+    if LLM_HEDGE_DELAY != "auto":
+        return float(LLM_HEDGE_DELAY)
+    p95 = latency.percentile(model, 0.95)
+    if p95 is None or latency.count(model) < 20:
+        return 8.0
+    return p95
+
+async def _timed_plan(prompt: str, model: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        result = await _stream_plan(prompt, model)
+    except asyncio.CancelledError:
+        latency.record(model, None, "cancelled")
+        metrics.LLM_SECONDS.observe(time.perf_counter() - t0, model, "stream", "cancelled")
+        raise
+    except Exception:
+        latency.record(model, None, "error")
+        metrics.LLM_SECONDS.observe(time.perf_counter() - t0, model, "stream", "error")
+        raise
+    elapsed = time.perf_counter() - t0
+    latency.record(model, elapsed)
+    metrics.LLM_SECONDS.observe(elapsed, model, "stream", "ok")
+    return result
+
+async def plan_hedged(prompt: str, models: Optional[List[str]] = None,
+                      delay: Optional[float] = None, deadline: float = LLM_DEADLINE,
+                      use_cache: bool = True) -> LLMEnvelope:
+    """
+    يطلق الموديل الأول؛ إذا لم يرجع خطة صالحة خلال delay (أو فشل) يطلق الموديل التالي،
+    ويأخذ أول خطة صالحة ويلغي الباقي. كل النداء محدود بـ deadline.
+    """
+    cached = await plan_cache.get(prompt) if use_cache else None
+    if cached is not None:
+        return LLMEnvelope(**coerce_json(cached))
+    queue = list(models or [OPENROUTER_MODEL, *OPENROUTER_HEDGE_MODELS])
+    delay = hedge_delay(queue[0]) if delay is None else delay
+    pending: set = set()
+    errors: List[str] = []
+
+    def fire() -> None:
+        model = queue.pop(0)
+        pending.add(asyncio.create_task(_timed_plan(prompt, model), name=model))
+
+    try:
+        async with asyncio.timeout(deadline):
+            fire()
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=delay if queue else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    pending.discard(t)
+                    if t.exception() is None:
+                        result = t.result()
+                        if use_cache:
+                            await plan_cache.put(prompt, serde.dumps_str(result))
+                        return LLMEnvelope(**result)
+                    errors.append(f"{t.get_name()}: {t.exception()}")
+                    logger.warning(f"[llm] {t.get_name()} failed: {t.exception()}")
+                if queue:
+                    # انتهت مهلة التحوّط أو فشل موديل → نطلق التالي
+                    fire()
+    except TimeoutError:
+        raise RuntimeError(f"LLM deadline of {deadline}s exceeded") from None
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    raise RuntimeError(f"All LLM models failed: {'; '.join(errors)}")
+
+
+def repair_prompt(prompt: str, plan: Dict[str, Any], errors: List[PlanError]) -> str:
+    """رسالة جولة الإصلاح: الطلب الأصلي + الخطة السابقة + الأخطاء البنيوية."""
+    problems = "\n".join(f"- [{e.code}] {e.message}" for e in errors)
+    return (
+        f"{prompt}\n\n"
+        "الخطة التالية فيها أخطاء بنيوية. أصلحها وأعد JSON كامل بنفس الـ schema فقط:\n"
+        f"{serde.dumps_str({'plan': plan})}\n"
+        f"الأخطاء:\n{problems}"
+    )
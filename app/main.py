@@ -1,10 +1,25 @@
 # app/main.py
-import os, json, asyncio, logging, re
-from typing import Any, Dict, Optional
+import os, time, uuid, asyncio, logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse, PlainTextResponse
-import httpx
+
+from . import llm, metrics, net, serde, state
+from .compiler import CompileError, compile_plan, cron_expression, describe_cron
+from .analyze import PromptInfo, analyze
+from .dedup import UpdateDeduper
+from .doc_cache import DocumentCache
+from .generator import default_plan
+from .jobs import JobScheduler
+from .journal import ACCEPTED, DONE, JOURNAL_OWNER_TTL, PLANNED, JobJournal
+from .poller import UpdatePoller
+from .ratelimit import PRIORITY_DOCUMENT, PRIORITY_MESSAGE, TG_RETRY_MAX, RateLimiter
+from .router import IntentRouter
+from .spec import Plan
+from .telegram import TG_API_URL
+from .validators import validate_many, validate_plan
 
 # ==== logging ====
 # استخدم لوجر uvicorn إن وُجد، وإلا لوجر باسم app
@@ -15,9 +30,45 @@ if not logger.handlers:
 
 # ==== env / telegram ====
 BOT_TOKEN = os.getenv("TG_BOT_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN")
-API_BASE = f"https://api.telegram.org/bot{BOT_TOKEN}" if BOT_TOKEN else None
+API_BASE = f"{TG_API_URL}/bot{BOT_TOKEN}" if BOT_TOKEN else None
+# webhook: Telegram يرسل التحديثات إلى /telegram — polling: البوت يسحبها بـ getUpdates (بدون رابط عام)
+TG_MODE = os.getenv("TG_MODE", "webhook").lower()
+# inline: رسائل الرد السريعة تُعاد داخل رد الـ webhook نفسه (Telegram ينفذها) بدل نداء HTTPS منفصل
+# call: السلوك القديم (sendMessage قبل إنهاء الـ webhook)
+WEBHOOK_REPLY = os.getenv("WEBHOOK_REPLY", "inline").lower()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await net.startup()
+    scheduler.start()
+    journal.start()
+    await resume_jobs()
+    await journal.commit()
+    resumer = asyncio.create_task(resume_loop()) if journal.enabled else None
+    if TG_MODE == "polling":
+        poller.start()
+    try:
+        yield
+    finally:
+        if resumer is not None:
+            resumer.cancel()
+            await asyncio.gather(resumer, return_exceptions=True)
+        await poller.stop()
+        await scheduler.drain()
+        await journal.close()
+        await net.shutdown()
+        state.get_backend().close()
 
-app = FastAPI(title="TG → n8n JSON Bot")
+scheduler = JobScheduler()
+journal = JobJournal()  # JOB_JOURNAL_PATH فارغ = بدون استئناف بعد إعادة التشغيل
+deduper = UpdateDeduper()
+router = IntentRouter()
+doc_cache = DocumentCache()
+skeletons = serde.SkeletonCache()  # workflow مسلسل مسبقًا لكل قالب في المسار السريع
+limiter = RateLimiter(backend=state.get_backend())
+_pending_status: Dict[int, list] = {}  # chat_id → نصوص رسالة حالة لم تُرسل بعد (للدمج)
+
+app = FastAPI(title="TG → n8n JSON Bot", lifespan=lifespan)
 
 # ==== helpers ====
 def pick_update(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -31,22 +82,102 @@ def get_chat_and_text(update_msg: Dict[str, Any]) -> tuple[Optional[int], Option
     text = update_msg.get("text") or update_msg.get("caption")
     return chat_id, text
 
-async def tg_call(method: str, data: Dict[str, Any], files: Dict[str, Any] | None = None) -> Dict[str, Any]:
+async def tg_call(method: str, data: Any, files: Dict[str, Any] | None = None,
+                  priority: Optional[int] = None, chat_id: Optional[int] = None,
+                  timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    نداء Bot API عبر محدِّد المعدل (للنداءات الموجهة لمحادثة) مع إعادة المحاولة عند 429.
+    data يمكن أن يكون دالة تبني الـ payload لحظة الإرسال (لدمج رسائل الحالة المنتظرة).
+    """
     if not API_BASE:
         return {"ok": False, "error": "missing_token"}
     url = f"{API_BASE}/{method}"
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(url, json=None if files else data, data=data if files else None, files=files)
+    client = net.get_async_client()
+    if priority is None:
+        priority = PRIORITY_DOCUMENT if method == "sendDocument" else PRIORITY_MESSAGE
+    if chat_id is None and isinstance(data, dict):
+        chat_id = data.get("chat_id")
+    attempt = 0
+    while True:
+        if chat_id is not None:
+            await limiter.acquire(chat_id, priority)
+            # عمال آخرون يرسلون أيضًا: ننتظر النافذة المشتركة التالية إن امتلأت
+            while (wait := await limiter.shared_delay(chat_id)) > 0:
+                await asyncio.sleep(wait)
+        payload = data() if callable(data) else data
+        t0, status = time.perf_counter(), "error"
+        try:
+            r = await client.post(url, json=None if files else payload, data=payload if files else None, files=files,
+                                  timeout=timeout or client.timeout)
+            status = str(r.status_code)
+        finally:
+            metrics.TG_SECONDS.observe(time.perf_counter() - t0, method, status)
+            metrics.TG_REQUESTS.inc(method, status)
         try:
-            return r.json()
+            res = r.json()
         except Exception:
             return {"ok": False, "status": r.status_code, "text": r.text}
+        retry_after = (res.get("parameters") or {}).get("retry_after") if res.get("error_code") == 429 else None
+        if retry_after is None or attempt >= TG_RETRY_MAX:
+            return res
+        delay = limiter.backoff(chat_id, retry_after, attempt)
+        logger.warning(f"[{method}] 429, retry {attempt + 1}/{TG_RETRY_MAX} in {delay:.1f}s")
+        if chat_id is None:
+            await asyncio.sleep(delay)
+        attempt += 1
 
 async def safe_send_message(chat_id: int, text: str) -> None:
-    payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
-    res = await tg_call("sendMessage", payload)
+    """رسالة حالة؛ إذا كانت هناك رسالة أخرى لنفس المحادثة تنتظر دورها تُدمج معها في رسالة واحدة."""
+    texts = _pending_status.get(chat_id)
+    if texts is not None:
+        texts.append(text)
+        limiter.merged += 1
+        return
+    texts = _pending_status[chat_id] = [text]
+
+    def payload() -> Dict[str, Any]:
+        if _pending_status.get(chat_id) is texts:  # لحظة الإرسال: لا دمج بعدها
+            del _pending_status[chat_id]
+        return _message_payload(chat_id, "\n".join(texts))
+
+    try:
+        res = await tg_call("sendMessage", payload, chat_id=chat_id)
+    finally:
+        if _pending_status.get(chat_id) is texts:
+            del _pending_status[chat_id]
     logger.info(f"[sendMessage] -> {res}")
 
+def _message_payload(chat_id: int, text: str) -> Dict[str, Any]:
+    return {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
+
+async def webhook_reply(chat_id: int, text: str) -> Response:
+    """رد الـ webhook مع رسالة للمستخدم: inline في جسم الرد (بدون نداء خارجي) أو sendMessage منفصل."""
+    if WEBHOOK_REPLY == "inline":
+        limiter.consume(chat_id)
+        return JSONResponse({"method": "sendMessage", **_message_payload(chat_id, text)})
+    await safe_send_message(chat_id, text)
+    return JSONResponse({"ok": True})
+
+async def send_workflow(chat_id: int, content: bytes, caption: str) -> Dict[str, Any]:
+    """sendDocument بـ file_id إذا أُرسل نفس المحتوى سابقًا، وإلا رفع multipart وحفظ file_id."""
+    key = doc_cache.key(content)
+    file_id = await doc_cache.get(key)
+    if file_id:
+        res = await tg_call("sendDocument", {"chat_id": chat_id, "document": file_id, "caption": caption})
+        if res.get("ok"):
+            doc_cache.reused += 1
+            doc_cache.bytes_saved += len(content)
+            return res
+        logger.warning(f"[sendDocument] cached file_id rejected, re-uploading: {res}")
+        await doc_cache.drop(key)
+    files = {"document": ("workflow.json", content, "application/json")}
+    res = await tg_call("sendDocument", {"chat_id": chat_id, "caption": caption}, files=files)
+    doc_cache.uploaded += 1
+    new_id = ((res.get("result") or {}).get("document") or {}).get("file_id") if res.get("ok") else None
+    if new_id:
+        await doc_cache.put(key, new_id)
+    return res
+
 # ==== routes ====
 @app.get("/", response_class=PlainTextResponse)
 async def root() -> str:
@@ -57,112 +188,193 @@ async def health() -> Dict[str, Any]:
     return {
         "ok": True,
         "has_token": bool(BOT_TOKEN),
+        "mode": TG_MODE,
+        "state": state.get_backend().stats(),
+        "webhook_reply": WEBHOOK_REPLY,
+        "dedup": deduper.stats(),
+        "router": router.stats(),
+        "documents": doc_cache.stats(),
+        "rate_limit": limiter.stats(),
+        "plan_cache": llm.plan_cache.stats(),
+        "journal": journal.stats(),
+        "llm_latency": llm.latency.snapshot(),
+        **({"polling": poller.stats()} if TG_MODE == "polling" else {}),
         "env": {"PORT": os.getenv("PORT"), "TZ": os.getenv("TIMEZONE")},
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> Response:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/validate", response_class=JSONResponse)
+async def validate_plans(request: Request) -> Dict[str, Any]:
+    """فحص دفعة خطط: {"plans": [...]} (أو قائمة مباشرة) → أخطاء كل خطة."""
+    payload = serde.loads(await request.body() or b"[]")
+    plans = payload.get("plans", []) if isinstance(payload, dict) else payload
+    results = validate_many([p.get("plan", p) if isinstance(p, dict) else p for p in plans])
+    return {
+        "ok": True,
+        "results": [{"valid": not errs, "errors": [e.model_dump(exclude_none=True) for e in errs]} for errs in results],
+    }
+
+async def handle_update(payload: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """
+    مشترك بين الـ webhook والـ polling: يجدول الطلب الثقيل في الخلفية،
+    ويعيد (chat_id, نص) للرد السريع إن وُجد.
+    """
+    if await deduper.seen(payload):
+        logger.info(f"[update] duplicate update {payload.get('update_id')}, skipped")
+        return None
+
+    update_msg = pick_update(payload)
+    if not update_msg:
+        logger.warning("[update] no supported message in update")
+        return None
+
+    chat_id, text = get_chat_and_text(update_msg)
+    if not chat_id:
+        logger.warning("[update] no chat_id")
+        return None
+
+    if not text:
+        return chat_id, "✅ استلمت رسالة غير نصية. أرسل نصًا لوصف الأتمتة المطلوبة."
+
+    update_id = payload.get("update_id")
+    job_id = f"u{update_id}" if update_id is not None else uuid.uuid4().hex
+    if not scheduler.submit(chat_id, handle_automation_request, chat_id, text, time.perf_counter(), job_id):
+        logger.warning(f"[update] busy, queue depth={scheduler.depth}")
+        return chat_id, "⏳ البوت مشغول حاليًا بطلبات كثيرة. أعد المحاولة بعد قليل."
+
+    journal.record(job_id, ACCEPTED, {"chat_id": chat_id, "text": text, "update_id": update_id})
+    return chat_id, "✅ استلمت طلبك. جاري إعداد خطة الأتمتة…"
+
 @app.post("/telegram")
 async def telegram_webhook(request: Request) -> Response:
-    try:
-        body = await request.body()
-        logger.info(f"[webhook raw] {body.decode('utf-8','ignore')}")
-        payload = json.loads(body or b"{}")
-
-        update_msg = pick_update(payload)
-        if not update_msg:
-            logger.warning("[webhook] no supported message in update")
+    with metrics.WEBHOOK_SECONDS.time():
+        try:
+            body = await request.body()
+            logger.info(f"[webhook raw] {body.decode('utf-8','ignore')}")
+            reply = await handle_update(serde.loads(body or b"{}"))
+            await journal.commit()  # الطلب على القرص قبل أن يعتبره Telegram مستلمًا
+            if reply is not None:
+                return await webhook_reply(*reply)
             return JSONResponse({"ok": True})
 
-        chat_id, text = get_chat_and_text(update_msg)
-        if not chat_id:
-            logger.warning("[webhook] no chat_id")
+        except Exception as e:
+            logger.exception(f"[webhook] exception: {e}")
             return JSONResponse({"ok": True})
 
-        if not text:
-            await safe_send_message(chat_id, "✅ استلمت رسالة غير نصية. أرسل نصًا لوصف الأتمتة المطلوبة.")
-            return JSONResponse({"ok": True})
+async def poll_update(payload: Dict[str, Any]) -> None:
+    reply = await handle_update(payload)
+    await journal.commit()
+    if reply is not None:
+        await safe_send_message(*reply)
 
-        await safe_send_message(chat_id, "✅ استلمت طلبك. جاري إعداد خطة الأتمتة…")
-        asyncio.create_task(handle_automation_request(chat_id, text))
-        return JSONResponse({"ok": True})
+async def resume_jobs() -> None:
+    """مهام قبلتها عملية سابقة ولم تنتهِ (إعادة تشغيل/نوم الخادم): تُجدول من آخر مرحلة مكتملة."""
+    for job in await journal.recover():
+        try:
+            plan = Plan.model_validate(job.plan) if job.plan is not None else None
+        except Exception as e:
+            # خطة محفوظة لا تطابق المخطط الحالي (نشر جديد): نسقط المهمة بدل إيقاف الإقلاع
+            logger.error(f"[journal] job {job.job_id} has an unreadable plan, dropped: {e}")
+            journal.record(job.job_id, DONE, {"outcome": "corrupt"})
+            continue
+        await deduper.seen({"update_id": job.update_id})  # Telegram قد يعيد إرسال نفس التحديث بعد إعادة التشغيل
+        if not scheduler.submit(job.chat_id, handle_automation_request, job.chat_id, job.text, None, job.job_id, plan):
+            logger.warning(f"[journal] queue full, job {job.job_id} left for the next start")
+            continue
+        logger.info(f"[journal] resumed job {job.job_id} ({'planned' if plan else 'accepted'})")
 
-    except Exception as e:
-        logger.exception(f"[webhook] exception: {e}")
-        return JSONResponse({"ok": True})
+async def resume_loop() -> None:
+    """مالك من نسخة أخرى (حاوية أُعيد نشرها) يُعتبر ميتًا بعد JOURNAL_OWNER_TTL بدون heartbeat: نعيد الفحص دوريًا."""
+    while True:
+        await asyncio.sleep(JOURNAL_OWNER_TTL)
+        try:
+            await resume_jobs()
+        except Exception as e:
+            logger.exception(f"[journal] periodic resume failed: {e}")
+
+poller = UpdatePoller(tg_call, poll_update, backend=state.get_backend())
+
+metrics.gauge("tgbot_job_queue_depth", "Accepted jobs not finished yet", lambda: scheduler.depth)
+metrics.gauge("tgbot_telegram_waiting_calls", "Bot API calls waiting on the rate limiter", lambda: limiter.depth)
+
+async def build_plan(user_text: str, info: Optional[PromptInfo] = None) -> Plan:
+    """
+    خطة من الـ LLM إذا كان مفعّلًا (مع جولة إصلاح واحدة)، وإلا (أو عند الفشل) الخطة الافتراضية.
+    (القوالب الجاهزة تُعالج قبل ذلك في handle_automation_request.)
+    """
+    info = info or analyze(user_text)
+    if llm.OPENROUTER_API_KEY:
+        try:
+            plan = (await llm.plan_hedged(user_text)).plan
+            with metrics.VALIDATE_SECONDS.time():
+                errors = validate_plan(plan)
+            if errors:
+                logger.info(f"[builder] plan has {len(errors)} error(s), asking LLM to repair")
+                repair = llm.repair_prompt(user_text, plan, errors)
+                plan = (await llm.plan_hedged(repair, use_cache=False)).plan
+                with metrics.VALIDATE_SECONDS.time():
+                    errors = validate_plan(plan)
+            if not errors:
+                return Plan.model_validate(plan)
+            logger.warning(f"[builder] LLM plan still invalid: {[e.code for e in errors]}")
+        except Exception as e:
+            logger.warning(f"[builder] LLM plan failed, using default plan: {e}")
+    return default_plan(user_text, info)
+
+def when_note(plan: Plan) -> str:
+    for step in plan.steps:
+        if step.type == "cron":
+            return describe_cron(cron_expression(step.params))
+    return "يدوي/عند التشغيل"
 
-async def handle_automation_request(chat_id: int, user_text: str) -> None:
+async def handle_automation_request(chat_id: int, user_text: str, queued_at: Optional[float] = None,
+                                    job_id: Optional[str] = None, plan: Optional[Plan] = None) -> None:
+    """plan: خطة محفوظة في سجل المهام (استئناف بعد إعادة التشغيل) فلا نطلب الـ LLM مرة ثانية."""
+    t0 = time.perf_counter()
+    if queued_at is not None:
+        metrics.QUEUE_WAIT_SECONDS.observe(t0 - queued_at)
+    outcome = "ok"
     try:
-        time_match = re.search(r"(\d{1,2}):(\d{2})", user_text)
-        if time_match:
-            hh, mm = time_match.group(1), time_match.group(2)
-            cron = f"{int(mm)} {int(hh)} * * *"
-            when_note = f"{hh}:{mm}"
-            trigger_node = {
-                "id": "n1",
-                "name": "Cron",
-                "type": "n8n-nodes-base.cron",
-                "typeVersion": 1,
-                "parameters": {"rule": {"interval": "custom", "customInterval": cron}},
-            }
-            trigger_name = "Cron"
+        info = analyze(user_text)
+        hit = router.match(user_text, info) if plan is None else None
+        if hit is not None:
+            # قالب جاهز (بدون LLM): bytes الـ workflow من هيكل مسلسل مسبقًا + قيم الطلب
+            tpl, values = hit
+            logger.info(f"[builder] fast path: template {tpl.name}")
+            with metrics.BUILD_SECONDS.time("skeleton"):
+                content = skeletons.render(tpl.name, lambda m: compile_plan(tpl.make(**m)), values)
+            when = describe_cron(values["cron"])
         else:
-            when_note = "يدوي/عند التشغيل"
-            trigger_node = {
-                "id": "n1",
-                "name": "Manual Trigger",
-                "type": "n8n-nodes-base.manualTrigger",
-                "typeVersion": 1,
-                "parameters": {},
-            }
-            trigger_name = "Manual Trigger"
-
-        workflow = {
-            "name": "Generated by Bot",
-            "nodes": [
-                trigger_node,
-                {
-                    "id": "n2",
-                    "name": "HTTP Request",
-                    "type": "n8n-nodes-base.httpRequest",
-                    "typeVersion": 3,
-                    "parameters": {"url": "https://httpbin.org/anything", "method": "GET"},
-                },
-                {
-                    "id": "n3",
-                    "name": "Set",
-                    "type": "n8n-nodes-base.set",
-                    "typeVersion": 2,
-                    "parameters": {
-                        "keepOnlySet": True,
-                        "values": {"string": [{"name": "msg", "value": f"وُلدت من طلبك: {user_text[:160]}"}]},
-                    },
-                },
-                {
-                    "id": "n4",
-                    "name": "Telegram",
-                    "type": "n8n-nodes-base.telegram",
-                    "typeVersion": 2,
-                    "parameters": {"chatId": "={{$env.TELEGRAM_CHAT_ID}}", "text": "={{$json.msg}}"},
-                    "credentials": {"telegramApi": {"id": "TELEGRAM_CRED", "name": "Telegram Account"}},
-                },
-            ],
-            "connections": {
-                trigger_name: {"main": [{"node": "HTTP Request", "type": "main", "index": 0}]},
-                "HTTP Request": {"main": [{"node": "Set", "type": "main", "index": 0}]},
-                "Set": {"main": [{"node": "Telegram", "type": "main", "index": 0}]},
-            },
-            "settings": {"timezone": os.getenv("TIMEZONE", "Africa/Algiers")},
-        }
-
-        content = json.dumps(workflow, ensure_ascii=False).encode("utf-8")
-        files = {"document": ("workflow.json", content, "application/json")}
-        data = {"chat_id": chat_id, "caption": f"هذا هو ملف n8n جاهز للاستيراد.\n- موعد التنفيذ: {when_note} (افتراضي/مستخلص)."}
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{API_BASE}/sendDocument", data=data, files=files)
-            logger.info(f"[sendDocument] status={r.status_code} body={r.text}")
+            if plan is None:
+                plan = await build_plan(user_text, info)
+                journal.record(job_id, PLANNED, {"plan": plan.model_dump(exclude_none=True)})
+            try:
+                with metrics.BUILD_SECONDS.time("compile"):
+                    workflow = compile_plan(plan)
+            except CompileError as e:
+                logger.warning(f"[builder] plan did not compile, using default plan: {e}")
+                plan = default_plan(user_text, info)
+                workflow = compile_plan(plan)
+            when = when_note(plan)
+            with metrics.BUILD_SECONDS.time("serialize"):
+                content = serde.dumps(workflow)
+        caption = f"هذا هو ملف n8n جاهز للاستيراد.\n- موعد التنفيذ: {when} (افتراضي/مستخلص)."
+        res = await send_workflow(chat_id, content, caption)
+        logger.info(f"[sendDocument] -> {res}")
+        if not res.get("ok"):
+            outcome = "undelivered"
+        journal.record(job_id, DONE, {"outcome": outcome})
 
     except Exception as e:
+        outcome = "error"
         logger.exception(f"[builder] failed: {e}")
+        journal.record(job_id, DONE, {"outcome": outcome})
         try:
             await safe_send_message(chat_id, f"❌ حدث خطأ أثناء تجهيز الخطة: {e}")
         except Exception:
             pass
+    finally:
+        metrics.JOB_SECONDS.observe(time.perf_counter() - t0, outcome)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import time, bisect
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# مقاييس داخلية بصيغة Prometheus النصية (/metrics) بدون مكتبة خارجية.
+# التسجيل = زيادة رقم في dict (بدون أقفال؛ كل الكود في event loop واحد، وعمليات dict ذرية تحت الـ GIL)،
+# والتجميع التراكمي للـ buckets يحدث فقط عند القراءة.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = doc
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, n: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def samples(self) -> Iterator[str]:
+        for lv, v in self.values.items():
+            yield f"{self.name}{_fmt_labels(self.labels, lv)} {_num(v)}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Labels, List[float]] = {}  # [عدّ لكل bucket غير تراكمي..., +Inf, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for lv, row in self.values.items():
+            acc = 0.0
+            for bound, n in zip((*self.buckets, "+Inf"), row):
+                acc += n
+                le = 'le="' + (bound if isinstance(bound, str) else _num(bound)) + '"'
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, lv, le)} {_num(acc)}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, lv)} {_num(row[-1])}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, lv)} {_num(acc)}"
+
+class Gauge:
+    """قيمة تُقرأ لحظة الطلب من دالة (عمق الطابور...)، فلا تكلفة بين القراءات."""
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = doc
+        self.fn = fn
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_num(self.fn())}"
+
+REGISTRY: Dict[str, Any] = {}
+
+def _register(metric: Any) -> Any:
+    REGISTRY[metric.name] = metric
+    return metric
+
+def counter(name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, doc, labels))
+
+def histogram(name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(name, doc, labels, buckets))
+
+def gauge(name: str, doc: str, fn: Callable[[], float]) -> Gauge:
+    return _register(Gauge(name, doc, fn))
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY.values():
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.samples())
+    return "\n".join(lines) + "\n"
+
+# ==== مقاييس التطبيق ====
+
+WEBHOOK_SECONDS = histogram("tgbot_webhook_seconds", "Time to handle one Telegram webhook request")
+QUEUE_WAIT_SECONDS = histogram("tgbot_job_queue_wait_seconds", "Time a request waited in the job queue")
+JOB_SECONDS = histogram("tgbot_job_seconds", "Time to build and deliver one workflow", ("outcome",))
+LLM_SECONDS = histogram("tgbot_llm_request_seconds", "LLM request latency", ("model", "mode", "outcome"))
+LLM_TOKENS = counter("tgbot_llm_tokens_total", "LLM tokens reported by the provider", ("model", "kind"))
+VALIDATE_SECONDS = histogram("tgbot_plan_validation_seconds", "Plan graph validation time",
+                             buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+BUILD_SECONDS = histogram("tgbot_workflow_build_seconds", "Workflow build time per stage", ("stage",),
+                          buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.25))
+TG_SECONDS = histogram("tgbot_telegram_api_seconds", "Telegram Bot API call latency", ("method", "status"))
+TG_REQUESTS = counter("tgbot_telegram_api_requests_total", "Telegram Bot API calls", ("method", "status"))
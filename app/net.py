@@ -0,0 +1,62 @@
+from __future__ import annotations
+import os, logging, threading
+from typing import Optional
+
+import httpx
+
+# عميل HTTP مشترك لكل التطبيق: اتصال واحد keep-alive بدل handshake جديد في كل نداء.
+logger = logging.getLogger("app.net")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP2", "false").lower() in ("1", "true", "yes")
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def _http2_enabled() -> bool:
+    """HTTP/2 اختياري: يحتاج حزمة h2 (pip install httpx[http2])."""
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("[net] HTTP2=true but 'h2' is not installed; falling back to HTTP/1.1")
+        return False
+    return True
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=_limits(), http2=_http2_enabled())
+    return _async_client
+
+def get_sync_client() -> httpx.Client:
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(timeout=HTTP_TIMEOUT, limits=_limits(), http2=_http2_enabled())
+        return _sync_client
+
+async def startup() -> None:
+    get_async_client()
+
+async def shutdown() -> None:
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
@@ -0,0 +1,157 @@
+from __future__ import annotations
+import os, re, asyncio, hashlib, sqlite3, logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from . import state
+from .cache import SqliteStore, TTLCache
+from .validators import LLMEnvelope, coerce_json, validate_plan
+
+# كاش خطط الـ LLM: الطلبات المتشابهة ("كل يوم 8:00 أرسل سعر ...") تُطبَّع إلى مفتاح واحد،
+# والأوقات/الروابط تُستبدل بـ placeholders ثم تُعاد تعبئتها في الرد المخزّن.
+logger = logging.getLogger("app.plan_cache")
+
+PLAN_CACHE_MAX = int(os.getenv("PLAN_CACHE_MAX", "2000"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(7 * 24 * 3600)))
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", "")  # فارغ = ذاكرة فقط (أو STATE_BACKEND إن كان مشتركًا)
+PLAN_CACHE_DISK_MAX = int(os.getenv("PLAN_CACHE_DISK_MAX", "20000"))
+
+_DIACRITICS = re.compile("[\u064B-\u065F\u0670\u0640]")  # تشكيل + تطويل
+_SPACES = re.compile(r"\s+")
+_URL = re.compile(r"https?://[^\s\"'<>]+")
+_TIME = re.compile(r"(\d{1,2})\s*[:：]\s*(\d{2})")
+_HOUR_AR = re.compile(r"(الساعة\s+)(\d{1,2})(?![\d:：])")
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+
+Slots = List[Tuple[str, List[str]]]  # (اسم الـ slot, الصيغ التي قد تظهر في رد الـ LLM)
+
+def _int_forms(h: int, mi: int) -> List[str]:
+    """params خطوة cron كأرقام JSON (بمسافة بعد النقطتين أو بدونها)."""
+    return [f'"hour": {h}', f'"hour":{h}', f'"minute": {mi}', f'"minute":{mi}']
+
+def normalize(prompt: str) -> Tuple[str, Slots]:
+    """يرجع (نص مُطبَّع, slots). نفس الطلب بوقت/رابط مختلف → نفس النص المُطبَّع."""
+    text = _DIACRITICS.sub("", prompt.translate(_DIGITS))
+    slots: Slots = []
+
+    def url(m: re.Match) -> str:
+        name = f"url{len(slots)}"
+        slots.append((name, [m.group(0)]))
+        return f"⟦{name}⟧"
+
+    def tm(m: re.Match) -> str:
+        name = f"time{len(slots)}"
+        h, mi = int(m.group(1)), int(m.group(2))
+        # الصيغة كما كُتبت، الصيغة القياسية HH:MM، وصيغة cron "M H "، و params رقمية hour/minute
+        slots.append((name, [m.group(0), f"{h:02d}:{mi:02d}", f"{h}:{mi:02d}", f"{mi} {h} ", *_int_forms(h, mi)]))
+        return f"⟦{name}⟧"
+
+    def hour(m: re.Match) -> str:
+        # "الساعة 8" بدون دقائق: الرقم وحده عام جدًا، فالصيغ كلها بسياقها (HH:00، cron، hour/minute)
+        name = f"hour{len(slots)}"
+        h = int(m.group(2))
+        slots.append((name, [f"{h:02d}:00", f"{h}:00", f"0 {h} ", *_int_forms(h, 0)]))
+        return f"{m.group(1)}⟦{name}⟧"
+
+    text = _URL.sub(url, text)
+    text = _TIME.sub(tm, text)
+    text = _HOUR_AR.sub(hour, text)
+    return _SPACES.sub(" ", text).strip().lower(), slots
+
+def _templatize(response: str, slots: Slots) -> Optional[str]:
+    """يستبدل قيم الـ slots في الرد بالـ placeholders؛ None إذا قيمة غير موجودة (لا يمكن التعميم)."""
+    out = response
+    for name, forms in slots:
+        # الأطول أولاً، وبدون لصق أرقام: "8:00" لا تطابق داخل "18:00"
+        order = sorted(range(len(forms)), key=lambda i: -len(forms[i]))
+        pattern = re.compile("|".join(f"(?<!\\d)({re.escape(forms[i])})(?!\\d)" for i in order))
+        out, n = pattern.subn(lambda m: f"⟦{name}.{order[m.lastindex - 1]}⟧", out)
+        if not n:
+            return None
+    return out
+
+def _fill(template: str, slots: Slots) -> str:
+    out = template
+    for name, forms in slots:
+        for i, form in enumerate(forms):
+            out = out.replace(f"⟦{name}.{i}⟧", form)
+    return out
+
+class PlanCache:
+    def __init__(self, namespace: str = "", maxsize: int = PLAN_CACHE_MAX, ttl: float = PLAN_CACHE_TTL,
+                 path: str = PLAN_CACHE_PATH, disk_max: int = PLAN_CACHE_DISK_MAX):
+        self.namespace = namespace
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk: Optional[Union[SqliteStore, state.SharedStore]] = None
+        if path:
+            try:
+                self.disk = SqliteStore(path, "plans", ttl, disk_max)
+            except sqlite3.Error as e:
+                logger.warning(f"[plan_cache] disk tier disabled ({path}): {e}")
+        else:
+            self.disk = state.shared_store("plan", ttl)
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.skipped = 0  # ردود لا يمكن تعميمها أو غير صالحة
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    async def _disk(self, method: str, *args: Any) -> Any:
+        """الطبقة الثانية (قرص أو STATE_BACKEND) في thread؛ خطأ = miss، فالكاش لا يُسقط الطلب."""
+        try:
+            return await asyncio.to_thread(getattr(self.disk, method), *args)
+        except state.BACKEND_ERRORS as e:
+            logger.warning(f"[plan_cache] disk tier {method} failed: {e}")
+            return None
+
+    async def get(self, prompt: str) -> Optional[str]:
+        normalized, slots = normalize(prompt)
+        key = self._key(normalized)
+        template = self.memory.get(key)
+        if template is not None:
+            self.hits_memory += 1
+            return _fill(template, slots)
+        if self.disk is not None:
+            template = await self._disk("get", key)
+            if template is not None:
+                self.memory.set(key, template)
+                self.hits_disk += 1
+                return _fill(template, slots)
+        self.misses += 1
+        return None
+
+    async def put(self, prompt: str, response: str) -> bool:
+        """يخزن رد الـ LLM فقط إذا كان خطة صالحة (JSON + بنية) ويمكن تعميمه على نفس القالب."""
+        try:
+            envelope = LLMEnvelope(**coerce_json(response))
+        except Exception:
+            self.skipped += 1
+            return False
+        if validate_plan(envelope.plan):
+            self.skipped += 1  # خطة بأخطاء بنيوية لا تُخزّن
+            return False
+        normalized, slots = normalize(prompt)
+        template = _templatize(response, slots)
+        if template is None:
+            self.skipped += 1
+            return False
+        key = self._key(normalized)
+        self.memory.set(key, template)
+        if self.disk is not None:
+            await self._disk("set", key, template)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "size": len(self.memory),
+            "disk": bool(self.disk),
+            "shared": isinstance(self.disk, state.SharedStore),
+        }
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import os, socket, asyncio, logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from . import state
+
+# وضع long-polling بديل للـ webhook: لا يحتاج رابطًا عامًا، ويستلم حتى POLL_LIMIT تحديثًا في كل نداء.
+# الـ offset يُحسب فور وصول الدفعة، فيُطلق الـ getUpdates التالي قبل معالجة الدفعة الحالية.
+# مع عدة عمال/نسخ: عامل واحد فقط يسحب (قفل lease في STATE_BACKEND يُجدد قبل كل نداء)، والباقي احتياط.
+logger = logging.getLogger("app.poller")
+
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "30"))  # ثوانٍ ينتظرها Telegram قبل رد فارغ
+POLL_LIMIT = int(os.getenv("POLL_LIMIT", "100"))
+POLL_BACKOFF_MAX = float(os.getenv("POLL_BACKOFF_MAX", "30"))
+POLL_LEASE_TTL = float(os.getenv("POLL_LEASE_TTL", str(POLL_TIMEOUT + 30)))
+LEASE_KEY = "lease:poller"
+ALLOWED_UPDATES = ["message", "edited_message", "channel_post", "edited_channel_post"]
+
+TgCall = Callable[..., Awaitable[Dict[str, Any]]]
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+class UpdatePoller:
+    def __init__(self, call: TgCall, handle: UpdateHandler,
+                 timeout: int = POLL_TIMEOUT, limit: int = POLL_LIMIT,
+                 backend: Optional[state.StateBackend] = None, lease_ttl: float = POLL_LEASE_TTL):
+        self.call = call
+        self.handle = handle
+        self.timeout = timeout
+        self.limit = limit
+        self.backend = backend
+        self.lease_ttl = max(lease_ttl, timeout + 10)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.leader = False
+        self.offset: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.polls = 0
+        self.updates = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.backend is not None and self.leader:
+            try:
+                await state.run(self.backend, "release_lease", LEASE_KEY, self.owner)
+            except state.BACKEND_ERRORS:
+                pass  # القفل ينتهي وحده بعد lease_ttl
+            self.leader = False
+
+    async def _hold_lease(self) -> bool:
+        """يأخذ القفل أو يجدده؛ False = عامل آخر هو من يسحب التحديثات."""
+        if self.backend is None:
+            self.leader = True
+            return True
+        try:
+            self.leader = await state.run(self.backend, "acquire_lease", LEASE_KEY, self.owner, self.lease_ttl)
+        except state.BACKEND_ERRORS:
+            # بدون backend لا نعرف من القائد: نسحب (Telegram يرد 409 على النداءات المتزامنة) بدل أن يتوقف الجميع
+            self.leader = True
+        return self.leader
+
+    async def _fetch(self, offset: Optional[int]) -> List[Dict[str, Any]]:
+        data: Dict[str, Any] = {"timeout": self.timeout, "limit": self.limit, "allowed_updates": ALLOWED_UPDATES}
+        if offset is not None:
+            data["offset"] = offset
+        res = await self.call("getUpdates", data, timeout=self.timeout + 10)
+        self.polls += 1
+        if not res.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {res}")
+        return res.get("result") or []
+
+    async def _dispatch(self, update: Dict[str, Any]) -> None:
+        try:
+            await self.handle(update)
+        except Exception as e:
+            logger.exception(f"[poller] update {update.get('update_id')} failed: {e}")
+
+    async def _retry_in(self, backoff: float, error: Exception) -> float:
+        """ينتظر backoff بعد خطأ ويعيد المهلة التالية (مضاعفة حتى POLL_BACKOFF_MAX)."""
+        self.errors += 1
+        logger.warning(f"[poller] {error!r}; retrying in {backoff:.0f}s")
+        await asyncio.sleep(backoff)
+        return min(POLL_BACKOFF_MAX, backoff * 2)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            # أي خطأ غير متوقع (شبكة، backend...) لا ينهي المهمة: بدون poller لا تصل أي تحديثات
+            try:
+                while not await self._hold_lease():
+                    await asyncio.sleep(self.lease_ttl / 3)
+                logger.info(f"[poller] {self.owner} is polling")
+                await self._poll()
+                logger.info(f"[poller] {self.owner} lost the poller lease")
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                backoff = await self._retry_in(backoff, e)
+
+    async def _poll(self) -> None:
+        # getUpdates يرفض العمل (409) طالما هناك webhook مسجل
+        backoff = 1.0
+        while True:
+            try:
+                res = await self.call("deleteWebhook", {})
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                backoff = await self._retry_in(backoff, e)
+        if not res.get("ok"):
+            logger.warning(f"[poller] deleteWebhook -> {res}")
+        backoff = 1.0
+        pending = asyncio.create_task(self._fetch(self.offset))
+        try:
+            while True:
+                try:
+                    batch = await pending
+                    backoff = 1.0
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    backoff = await self._retry_in(backoff, e)
+                    batch = []
+                if batch:
+                    self.offset = max(u.get("update_id", 0) for u in batch) + 1
+                    self.updates += len(batch)
+                # الاستطلاع التالي يطير بينما نوزع الدفعة الحالية (ما دام القفل معنا)
+                lost = not await self._hold_lease()
+                if not lost:
+                    pending = asyncio.create_task(self._fetch(self.offset))
+                if batch:
+                    await asyncio.gather(*(self._dispatch(u) for u in batch))
+                if lost:
+                    return
+        finally:
+            pending.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "polls": self.polls,
+            "updates": self.updates,
+            "errors": self.errors,
+            "avg_batch": round(self.updates / self.polls, 2) if self.polls else 0.0,
+            "offset": self.offset,
+            "leader": self.leader,
+        }
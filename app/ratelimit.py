@@ -0,0 +1,184 @@
+from __future__ import annotations
+import os, math, time, random, asyncio, bisect, logging, itertools
+from typing import Any, Dict, Hashable, List, Optional
+
+from . import state
+
+# حدود Telegram للإرسال: ~30 رسالة/ثانية للبوت كله، ~1/ثانية لكل محادثة، و20/دقيقة في المجموعات.
+# دلو رموز (token bucket) عام + دلو لكل محادثة، وطابور أولويات واحد أمام كل نداءات Bot API.
+# مع STATE_BACKEND مشترك تُضاف نوافذ زمنية ثابتة مشتركة بين العمال (الدلاء المحلية لا ترى بعضها).
+logger = logging.getLogger("app.ratelimit")
+
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))
+TG_GROUP_PER_MIN = float(os.getenv("TG_GROUP_PER_MIN", "20"))
+TG_RETRY_MAX = int(os.getenv("TG_RETRY_MAX", "3"))
+TG_RETRY_JITTER = float(os.getenv("TG_RETRY_JITTER", "0.5"))
+CHAT_BUCKETS_MAX = 10000
+
+# رقم أصغر = يُرسل أولاً
+PRIORITY_MESSAGE = 0   # إشعارات الاستلام/الحالة/الأخطاء
+PRIORITY_DOCUMENT = 1  # ملفات workflow.json
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0  # retry_after من Telegram
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def wait(self, now: float) -> float:
+        """ثوانٍ حتى يتوفر رمز (0 = الآن)."""
+        self._refill(now)
+        lack = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(lack, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1  # قد يصبح سالبًا (رد inline لم ينتظر): الرسالة التالية تنتظر أكثر
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+class RateLimiter:
+    """
+    acquire() ينتظر حتى يسمح الدلوان العام والخاص بالمحادثة، بترتيب الأولوية ثم الوصول.
+    محادثة محجوبة لا توقف بقية المحادثات خلفها؛ لا توجد مهمة خلفية، فقط مؤقت واحد عند الحاجة.
+    """
+
+    def __init__(self, global_rate: float = TG_GLOBAL_RATE, chat_rate: float = TG_CHAT_RATE,
+                 chat_burst: float = TG_CHAT_BURST, group_per_min: float = TG_GROUP_PER_MIN,
+                 backend: Optional[state.StateBackend] = None):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_min = group_per_min
+        self.group_rate = group_per_min / 60
+        self.backend = backend if backend is not None and backend.shared else None
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._waiting: List[tuple] = []  # (priority, seq, chat_id, future) مرتبة
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.delayed = 0
+        self.throttled = 0  # ردود 429
+        self.merged = 0     # رسائل حالة دُمجت في رسالة منتظرة
+        self.shared_waits = 0  # انتظار بسبب نوافذ العمال الآخرين
+
+    def _bucket(self, chat_id: Hashable) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            if len(self._chats) >= CHAT_BUCKETS_MAX:
+                now = time.monotonic()
+                self._chats = {k: v for k, v in self._chats.items() if not v.full(now)}
+            # chat_id سالب = مجموعة/قناة
+            group = isinstance(chat_id, int) and chat_id < 0
+            b = self._chats[chat_id] = TokenBucket(min(self.chat_rate, self.group_rate) if group else self.chat_rate,
+                                                   self.chat_burst)
+        return b
+
+    async def acquire(self, chat_id: Hashable, priority: int = PRIORITY_MESSAGE) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        bisect.insort(self._waiting, (priority, next(self._seq), chat_id, fut))
+        self._pump()
+        if not fut.done():
+            self.delayed += 1
+        await fut
+
+    def consume(self, chat_id: Hashable) -> None:
+        """رسالة أُرسلت خارج الطابور (رد inline في الـ webhook): نحسبها من الدلوين بدون انتظار."""
+        self.global_bucket.take()
+        self._bucket(chat_id).take()
+
+    def backoff(self, chat_id: Optional[Hashable], retry_after: float, attempt: int) -> float:
+        """429: نحجب المحادثة retry_after ثانية + jitter يكبر مع المحاولات، ونعيد مدة الانتظار."""
+        self.throttled += 1
+        delay = float(retry_after) + random.uniform(0, TG_RETRY_JITTER * (attempt + 1))
+        bucket = self.global_bucket if chat_id is None else self._bucket(chat_id)
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+        return delay
+
+    async def shared_delay(self, chat_id: Hashable) -> float:
+        """
+        بعد acquire(): عدّاد النافذة العامة (ثانية) ونافذة المحادثة (ثانية، أو دقيقة للمجموعات)
+        في رحلة واحدة للـ backend المشترك. 0 = مسموح، وإلا ثوانٍ حتى النافذة التالية.
+        backend غير متاح = 0: الدلاء المحلية وحدها (وردود 429) تحدد السرعة.
+        """
+        if self.backend is None:
+            return 0.0
+        now = time.time()
+        group = isinstance(chat_id, int) and chat_id < 0
+        window, limit = (60, self.group_per_min) if group else (1, max(1, math.ceil(self.chat_rate)))
+        sec, slot = int(now), int(now // window)
+        try:
+            counts = await state.run(self.backend, "incr_many",
+                                     [(f"rl:g:{sec}", 2), (f"rl:c:{chat_id}:{slot}", window + 1)])
+        except state.RedisReplyError as e:
+            # الخادم يرفض الأمر (إصدار/إعداد غير مدعوم): النوافذ المشتركة لا تعمل، فلا نخفي ذلك
+            logger.warning(f"[ratelimit] shared window rejected by the backend: {e}")
+            return 0.0
+        except state.BACKEND_ERRORS:
+            return 0.0
+        delay = 0.0
+        if counts[0] > self.global_rate:
+            delay = sec + 1 - now
+        if counts[1] > limit:
+            delay = max(delay, (slot + 1) * window - now)
+        if delay > 0:
+            self.shared_waits += 1
+        return delay
+
+    def _pump(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        next_in: Optional[float] = None
+        keep: List[tuple] = []
+        for i, entry in enumerate(self._waiting):
+            fut = entry[3]
+            if fut.done():  # أُلغي الانتظار
+                continue
+            g = self.global_bucket.wait(now)
+            if g > 0:
+                next_in = g if next_in is None else min(next_in, g)
+                keep += [e for e in self._waiting[i:] if not e[3].done()]
+                break
+            bucket = self._bucket(entry[2])
+            w = bucket.wait(now)
+            if w > 0:
+                next_in = w if next_in is None else min(next_in, w)
+                keep.append(entry)
+                continue
+            self.global_bucket.take()
+            bucket.take()
+            self.granted += 1
+            fut.set_result(None)
+        self._waiting = keep
+        if keep and next_in is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_in, self._pump)
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiting)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "throttled_429": self.throttled,
+            "merged": self.merged,
+            "shared_waits": self.shared_waits,
+            "waiting": self.depth,
+            "chats": len(self._chats),
+        }
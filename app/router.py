@@ -0,0 +1,114 @@
+from __future__ import annotations
+import os, re, math
+from typing import Any, Dict, List, Optional, Tuple
+
+from .analyze import PromptInfo, analyze
+from .skills import TEMPLATES, Slots, Template
+from .spec import Plan
+
+# المسار السريع: فهرس نوايا (كلمات + trigrams حروف، عربي/إنجليزي) فوق كتالوج القوالب.
+# يُبنى مرة عند الاستيراد؛ كل طلب يُقيَّم بالميكروثواني، وفوق العتبة نملأ القالب مباشرة بدون LLM.
+
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.3"))
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_NOISE = re.compile("https?://\\S+|[\u064B-\u065F\u0670\u0640]|\\d+")
+_WORD = re.compile(r"\w+")
+_PREFIXES = ("وال", "بال", "فال", "ال")
+WORD_WEIGHT = 2.0
+
+def features(text: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for tok in _WORD.findall(_NOISE.sub(" ", text.lower())):
+        for p in _PREFIXES:  # تجريد خفيف لأداة التعريف العربية
+            if tok.startswith(p) and len(tok) > len(p) + 2:
+                tok = tok[len(p):]
+                break
+        if len(tok) < 2:
+            continue
+        out["w:" + tok] = out.get("w:" + tok, 0.0) + WORD_WEIGHT
+        padded = f" {tok} "
+        for i in range(len(padded) - 2):
+            key = "c:" + padded[i:i + 3]
+            out[key] = out.get(key, 0.0) + 1.0
+    return out
+
+def _unit(vec: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {k: v / norm for k, v in vec.items()}
+
+class IntentIndex:
+    def __init__(self, templates: List[Template]):
+        self.templates = templates
+        raw = []
+        for t in templates:
+            vec: Dict[str, float] = {}
+            for phrase in t.phrases:
+                for k, v in features(phrase).items():
+                    vec[k] = vec.get(k, 0.0) + v
+            raw.append(vec)
+        df: Dict[str, int] = {}
+        for vec in raw:
+            for k in vec:
+                df[k] = df.get(k, 0) + 1
+        n = len(templates)
+        idf = {k: math.log(1 + n / d) for k, d in df.items()}
+        # فهرس مقلوب: ميزة → (idf, [(رقم القالب, الوزن المُطبَّع)])
+        self.postings: Dict[str, Tuple[float, List[Tuple[int, float]]]] = {}
+        for i, vec in enumerate(raw):
+            for k, v in _unit({k: v * idf[k] for k, v in vec.items()}).items():
+                self.postings.setdefault(k, (idf[k], []))[1].append((i, v))
+
+    def score(self, prompt: str) -> List[Tuple[float, Template]]:
+        """تشابه cosine (TF-IDF) مع كل قالب، مرتب تنازليًا."""
+        dots = [0.0] * len(self.templates)
+        norm = 0.0
+        for k, v in features(prompt).items():
+            hit = self.postings.get(k)
+            if hit is None:
+                continue
+            w = v * hit[0]
+            norm += w * w
+            for i, x in hit[1]:
+                dots[i] += w * x
+        norm = math.sqrt(norm) or 1.0
+        scored = [(d / norm, t) for d, t in zip(dots, self.templates)]
+        scored.sort(key=lambda st: st[0], reverse=True)
+        return scored
+
+class IntentRouter:
+    def __init__(self, templates: List[Template] = TEMPLATES, threshold: float = ROUTER_THRESHOLD):
+        self.index = IntentIndex(templates)
+        self.threshold = threshold
+        self.routed: Dict[str, int] = {t.name: 0 for t in templates}
+        self.fallback = 0
+
+    def match(self, prompt: str, info: Optional[PromptInfo] = None) -> Optional[Tuple[Template, Slots]]:
+        """(القالب, قيم خاناته) إذا الثقة فوق العتبة والقالب اكتملت خاناته؛ وإلا None (→ LLM)."""
+        if ROUTER_ENABLED:
+            info = info or analyze(prompt)
+            for score, t in self.index.score(prompt):
+                if score < self.threshold:
+                    break
+                values = t.slots(prompt, info)
+                if values is not None:
+                    self.routed[t.name] += 1
+                    return t, values
+        self.fallback += 1
+        return None
+
+    def route(self, prompt: str, info: Optional[PromptInfo] = None) -> Optional[Tuple[str, Plan]]:
+        """(اسم القالب, خطة) أو None."""
+        hit = self.match(prompt, info)
+        return None if hit is None else (hit[0].name, hit[0].make(**hit[1]))
+
+    def stats(self) -> Dict[str, Any]:
+        fast = sum(self.routed.values())
+        total = fast + self.fallback
+        return {
+            "fast_path": fast,
+            "fallback": self.fallback,
+            "fast_path_ratio": round(fast / total, 4) if total else 0.0,
+            "by_template": dict(self.routed),
+            "threshold": self.threshold,
+        }
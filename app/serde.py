@@ -0,0 +1,76 @@
+from __future__ import annotations
+import json
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Union
+
+# طبقة JSON واحدة لكل التطبيق: orjson إذا كان مثبتًا (pip install orjson)، وإلا json القياسي.
+# الناتج دائمًا UTF-8 بدون تهريب الحروف العربية.
+try:
+    import orjson
+except ImportError:  # اختياري
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # أعداد أكبر من 64 بت وما شابه: المكتبة القياسية تتعامل معها
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+# ==== هياكل بايتات جاهزة (skeletons) ====
+# Workflow من قالب ثابت يختلف فقط في قيم نصية قليلة (cron، url، الرسالة، المنطقة الزمنية):
+# نبنيه ونسلسله مرة بعلامات مكان القيم، ثم كل طلب = تهريب القيم ولصق أجزاء bytes.
+
+def marker(slot: str) -> str:
+    return f"@@slot:{slot}@@"
+
+class Skeleton:
+    def __init__(self, data: bytes, slots: Sequence[str]):
+        marks = {marker(s).encode(): s for s in slots}
+        self.parts: List[bytes] = []
+        self.order: List[str] = []  # اسم الـ slot بين كل جزأين
+        rest = data
+        while True:
+            hits = [(rest.find(m), m) for m in marks if m in rest]
+            if not hits:
+                break
+            pos, m = min(hits)
+            self.parts.append(rest[:pos])
+            self.order.append(marks[m])
+            rest = rest[pos + len(m):]
+        self.parts.append(rest)
+
+    def fill(self, values: Dict[str, str]) -> bytes:
+        # كل العلامات داخل نصوص JSON: القيمة تُهرّب كنص JSON بدون علامتي التنصيص
+        enc = {s: dumps(str(values[s]))[1:-1] for s in set(self.order)}
+        out = [self.parts[0]]
+        for slot, part in zip(self.order, self.parts[1:]):
+            out.append(enc[slot])
+            out.append(part)
+        return b"".join(out)
+
+class SkeletonCache:
+    """key → Skeleton؛ build(markers) يبني الكائن (مثلًا workflow مترجم) بالعلامات بدل القيم."""
+
+    def __init__(self) -> None:
+        self._items: Dict[Hashable, Skeleton] = {}
+
+    def render(self, key: Hashable, build: Callable[[Dict[str, str]], Any], values: Dict[str, str]) -> bytes:
+        slots = tuple(sorted(values))
+        sk = self._items.get((key, slots))
+        if sk is None:
+            sk = self._items[(key, slots)] = Skeleton(dumps(build({s: marker(s) for s in slots})), slots)
+        return sk.fill(values)
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -1,6 +1,7 @@
-import os
-from typing import Dict, Any, List
-from .spec import WorkflowSpec, Step, Edge, Trigger
+import os, re
+from typing import Dict, List, Callable, NamedTuple, Optional
+from .analyze import PromptInfo
+from .spec import Plan, Step, Edge
 
 def has(var: str) -> bool:
     v = os.getenv(var, "")
@@ -22,12 +23,13 @@ def tpl_cron_http_to_telegram(name: str,
                               message: str = "={{$json.msg}}",
                               hour: int = 9,
                               minute: int = 0,
-                              chat_id_expr: str = "={{$env.TELEGRAM_CHAT_ID}}") -> WorkflowSpec:
-    spec = WorkflowSpec(
+                              chat_id_expr: str = "={{$env.TELEGRAM_CHAT_ID}}",
+                              cron: Optional[str] = None,
+                              timezone: Optional[str] = None) -> Plan:
+    spec = Plan(
         name=name,
-        timezone=os.getenv("TIMEZONE", "Africa/Algiers"),
-        trigger=Trigger(type="cron", config={"hour": hour, "minute": minute}),
-        steps=[],
+        timezone=timezone or os.getenv("TIMEZONE", "Africa/Algiers"),
+        steps=[Step(id="cron", type="cron", params={"cron": cron} if cron else {"hour": hour, "minute": minute})],
         edges=[]
     )
     spec.steps.append(Step(id="http", type="http", params={"url": url, "method": method}))
@@ -40,18 +42,18 @@ def tpl_cron_http_to_telegram(name: str,
         "message": message
     }))
     spec.edges += [
+        Edge(from_="cron", to="http"),
         Edge(from_="http", to="set"),
         Edge(from_="set", to="tg"),
     ]
     return spec
 
-def tpl_monitor_status_every_5min(url: str) -> WorkflowSpec:
-    # Cron كل 5 دقائق → HTTP → IF (status != 200) → HTTP(POST Telegram API)
-    spec = WorkflowSpec(
+def tpl_monitor_status_every_5min(url: str, cron: str = "*/5 * * * *", timezone: Optional[str] = None) -> Plan:
+    # Cron كل 5 دقائق (أو cron المطلوب) → HTTP → IF (status != 200) → HTTP(POST Telegram API)
+    spec = Plan(
         name="Monitor URL and alert to Telegram",
-        timezone=os.getenv("TIMEZONE", "Africa/Algiers"),
-        trigger=Trigger(type="cron", config={"hour": 0, "minute": "*/5"}),
-        steps=[],
+        timezone=timezone or os.getenv("TIMEZONE", "Africa/Algiers"),
+        steps=[Step(id="cron", type="cron", params={"cron": cron})],
         edges=[]
     )
     spec.steps.append(Step(id="http", type="http", params={"url": url, "method": "GET"}))
@@ -69,15 +71,17 @@ def tpl_monitor_status_every_5min(url: str) -> WorkflowSpec:
         }
     }))
     spec.edges += [
+        Edge(from_="cron", to="http"),
         Edge(from_="http", to="if"),
         Edge(from_="if", to="tghttp"),
     ]
     return spec
 
-def tpl_ai_video_outline_to_telegram(prompt: str) -> WorkflowSpec:
+def tpl_ai_video_outline_to_telegram(prompt: str, timezone: Optional[str] = None, cron: Optional[str] = None) -> Plan:
     """
     تبسيط لمهمة "اصنع فيديو بالذكاء الاصطناعي": نولّد سكريبت نصي من LLM (لو متاح)،
     ثم نرسله كرسالة/رابط — لأن إنشاء فيديو كامل ورفع تيك توك يحتاج مزودي مدفوعين و OAuth.
+    prompt يوضع داخل template literal في تعبير n8n: مرّره عبر js_text() إذا كان من المستخدم.
     """
     url = "https://httpbin.org/anything/ai-video-outline"
     # لو عندك OPENROUTER متاح، نستبدل HTTP بعقدة HTTP تُنادي خادمك لاحقًا؛ حالياً مجرد placeholder يعمل.
@@ -88,5 +92,89 @@ def tpl_ai_video_outline_to_telegram(prompt: str) -> WorkflowSpec:
         method="GET",
         set_expr=set_expr,
         message="={{$json.msg}}",
-        hour=9, minute=0
+        hour=9, minute=0,
+        cron=cron,
+        timezone=timezone,
     )
+
+# ===== كتالوج القوالب للمسار السريع (app/router.py) =====
+# كل قالب = slots(prompt, info) تستخرج قيمًا نصية (cron دائمًا، و url/message/tz)، و make(**slots) تبني الخطة منها فقط؛
+# لذلك يمكن تسلسل الـ workflow مرة بعلامات مكان القيم وإعادة استعماله (app/serde.py: SkeletonCache).
+
+Slots = Dict[str, str]
+
+class Template(NamedTuple):
+    name: str
+    phrases: List[str]  # أمثلة طلبات عربية/إنجليزية تُبنى منها ميزات الفهرس
+    slots: Callable[[str, PromptInfo], Optional[Slots]]  # None = الطلب ينقصه شيء → LLM
+    make: Callable[..., Plan]  # make(**slots) → Plan، بدون منطق يعتمد على القيم
+
+    def build(self, prompt: str, info: PromptInfo) -> Optional[Plan]:
+        values = self.slots(prompt, info)
+        return None if values is None else self.make(**values)
+
+def _tz() -> str:
+    return os.getenv("TIMEZONE", "Africa/Algiers")
+
+def js_text(text: str) -> str:
+    """نص آمن داخل `...` في تعبير n8n ={{ }}: لا ينهي الـ literal ولا يحقن ${...} ولا يغلق التعبير."""
+    return (text.replace("\\", "\\\\").replace("`", "\\`").replace("${", "\\${")
+            .replace("}}", "} }"))
+
+def _cron_http_slots(prompt: str, info: PromptInfo) -> Optional[Slots]:
+    params = info.cron_params()
+    if not info.scheduled or "hour" not in params or "weekday" in params or not info.url:
+        return None  # بدون رابط لا نعرف ماذا نجلب: الـ LLM يقرر
+    return {"cron": f"{params['minute']} {params['hour']} * * *", "url": info.url, "tz": _tz()}
+
+def _cron_http_make(cron: str, url: str, tz: str) -> Plan:
+    return tpl_cron_http_to_telegram(name="Scheduled HTTP to Telegram", url=url, cron=cron, timezone=tz)
+
+def _monitor_slots(prompt: str, info: PromptInfo) -> Optional[Slots]:
+    if not info.url:
+        return None
+    cron = info.cron_params()["cron"] if info.interval in ("minutes", "hours", "hourly") else "*/5 * * * *"
+    return {"cron": cron, "url": info.url, "tz": _tz()}
+
+def _monitor_make(cron: str, url: str, tz: str) -> Plan:
+    return tpl_monitor_status_every_5min(url, cron=cron, timezone=tz)
+
+# موضوع الفيديو: ما بعد about/عن/حول... حتى أول "and send" / "وأرسل" / نهاية الجملة
+_TOPIC = re.compile(r"(?:(?<!\w)(?:about|on|regarding|topic:?)|(?<!\w)(?:عن|حول|بعنوان|موضوعه|موضوع:?))\s+(.+)",
+                    re.IGNORECASE | re.DOTALL)
+_TOPIC_END = re.compile(r"\s+(?:and|then|to)\s+(?:send|post|share|publish|telegram)|\s+(?:و|ثم\s+)(?:أرسل|ارسل|ابعث|انشر)"
+                        r"|\s+(?:على|في|الى|إلى)\s+(?:تيليغرام|تلغرام|تليغرام|تليجرام|telegram)|[.,،؛!?؟\n]", re.IGNORECASE)
+
+def _video_slots(prompt: str, info: PromptInfo) -> Optional[Slots]:
+    m = _TOPIC.search(prompt)
+    if m is None:
+        return None  # "اصنع لي فيديو" بدون موضوع → الـ LLM
+    topic = _TOPIC_END.split(m.group(1), 1)[0].strip()
+    if len(re.sub(r"\W", "", topic)) < 3:
+        return None
+    return {"cron": "0 9 * * *", "message": js_text(topic[:200]), "tz": _tz()}
+
+def _video_make(cron: str, message: str, tz: str) -> Plan:
+    return tpl_ai_video_outline_to_telegram(message, timezone=tz, cron=cron)
+
+TEMPLATES: List[Template] = [
+    Template("cron_http_to_telegram", [
+        "every day at 8:00 send me the price on telegram",
+        "daily fetch data from a url and send it to telegram",
+        "كل يوم الساعة 8 أرسل لي السعر على تيليغرام",
+        "يوميا جيب البيانات من الرابط وابعثها لي في تلغرام",
+        "ابعث لي سعر الذهب كل صباح",
+    ], _cron_http_slots, _cron_http_make),
+    Template("monitor_status_every_5min", [
+        "monitor the website every 5 minutes and alert me if it is down",
+        "check the url status and notify me when it fails",
+        "راقب الموقع كل 5 دقائق ونبهني إذا توقف",
+        "تحقق من حالة الرابط وأرسل تنبيه إذا كان معطل",
+    ], _monitor_slots, _monitor_make),
+    Template("ai_video_outline_to_telegram", [
+        "make an ai video about a topic and send the outline to telegram",
+        "create a video script with ai",
+        "اصنع فيديو بالذكاء الاصطناعي عن موضوع",
+        "مخطط فيديو بالذكاء الاصطناعي وأرسله على تيليغرام",
+    ], _video_slots, _video_make),
+]
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Literal, Optional, Dict, Any
 
 # ---------- خطة مجردة (يُنتجها الـ LLM) ----------
@@ -13,6 +13,8 @@ class Step(BaseModel):
     params: Dict[str, Any] = Field(default_factory=dict)
 
 class Edge(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
     from_: str = Field(..., alias="from")
     to: str
 
@@ -44,5 +46,5 @@ class N8nNode(BaseModel):
 class N8nWorkflow(BaseModel):
     name: str
     nodes: List[N8nNode]
-    connections: Dict[str, Dict[str, List[Dict[str, Any]]]]
+    connections: Dict[str, Dict[str, List[List[Dict[str, Any]]]]]  # لازم تكون [[{...}]] (مخرج → وصلات)
     settings: Dict[str, Any] = Field(default_factory=dict)
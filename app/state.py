@@ -0,0 +1,483 @@
+from __future__ import annotations
+import os, time, socket, asyncio, sqlite3, logging, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+# حالة مشتركة بين عمليات/نسخ البوت (uvicorn --workers N أو أكثر من instance):
+# مفاتيح منع التكرار، طبقة ثانية لكاش الخطط والمستندات، نوافذ حدود الإرسال، وأقفال المهام (leases).
+#   STATE_BACKEND=memory                  (الافتراضي: عملية واحدة)
+#   STATE_BACKEND=sqlite:///path/state.db (عدة عمليات على نفس القرص، WAL)
+#   STATE_BACKEND=redis://host:6379/0     (عدة نسخ؛ عميل RESP مكتوب يدويًا بدون مكتبة)
+# كل عملية مجمّعة (add_many / incr_many) = رحلة واحدة للخادم (pipeline أو transaction واحدة).
+# الـ backend المشترك يُنادى عبر run() في thread (لا يحجب الـ event loop)، وإذا تعطل يُعتبر غير متاح
+# STATE_RETRY_AFTER ثانية: المستدعي يرجع لحالته المحلية (fail open) بدل فقدان التحديثات.
+logger = logging.getLogger("app.state")
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_MEMORY_MAX = int(os.getenv("STATE_MEMORY_MAX", "100000"))
+STATE_PREFIX = os.getenv("STATE_PREFIX", "tgbot:")  # لعزل أكثر من بوت على نفس Redis
+STATE_TIMEOUT = float(os.getenv("STATE_TIMEOUT", "1"))  # مهلة الاتصال/القراءة من Redis
+STATE_RETRY_AFTER = float(os.getenv("STATE_RETRY_AFTER", "10"))  # مدة تجاهل backend تعطل قبل المحاولة مجددًا
+
+class StateError(RuntimeError):
+    pass
+
+class StateUnavailable(StateError):
+    """الـ backend تعطل مؤخرًا؛ لا نحاول قبل انتهاء STATE_RETRY_AFTER."""
+
+BACKEND_ERRORS = (StateError, OSError, sqlite3.Error)
+
+class StateBackend:
+    """الواجهة: قيم نصية مع TTL اختياري (بالثواني)."""
+    name = "base"
+    shared = False  # True = مرئي لكل العمليات (يستحق أن يكون طبقة ثانية للكاش)
+    failures = 0
+    _down_until = 0.0  # time.monotonic() حتى يُعاد تجربة backend تعطل
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add_many(self, keys: Sequence[str], ttl: Optional[float] = None) -> List[bool]:
+        """يسجّل كل مفتاح غير موجود؛ True للمفاتيح التي أُضيفت الآن (كانت جديدة)."""
+        raise NotImplementedError
+
+    def incr_many(self, keys: Sequence[Tuple[str, float]]) -> List[int]:
+        """(مفتاح, ttl) → العدّاد بعد الزيادة؛ الـ TTL يبدأ مع أول زيادة (نوافذ زمنية ثابتة)."""
+        raise NotImplementedError
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """قفل ينتهي وحده بعد ttl (إذا ماتت العملية المالكة)."""
+        return self.add_many([key], ttl)[0] or self.get(key) == owner
+
+    def release_lease(self, key: str, owner: str) -> None:
+        if self.get(key) == owner:
+            self.delete(key)
+
+    def close(self) -> None:
+        pass
+
+    def guarded(self, method: str, *args: Any) -> Any:
+        """ينادي method؛ عند خطأ اتصال/قرص يُعلَّم الـ backend غير متاح STATE_RETRY_AFTER ثانية."""
+        if time.monotonic() < self._down_until:
+            raise StateUnavailable(f"{self.name} state backend is unavailable")
+        try:
+            return getattr(self, method)(*args)
+        except RedisReplyError:
+            raise  # الخادم يعمل؛ الخطأ في الأمر نفسه
+        except BACKEND_ERRORS as e:
+            self.failures += 1
+            self._down_until = time.monotonic() + STATE_RETRY_AFTER
+            logger.warning(f"[state] {self.name} backend failed ({e}); using local state for {STATE_RETRY_AFTER:.0f}s")
+            raise StateUnavailable(str(e)) from e
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "available": self.available, "failures": self.failures}
+
+# ==== memory ====
+
+class MemoryBackend(StateBackend):
+    name = "memory"
+
+    def __init__(self, maxsize: int = STATE_MEMORY_MAX):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def _put(self, key: str, value: str, ttl: Optional[float], now: float) -> None:
+        self._data[key] = (value, now + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            return None if item is None else item[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._put(key, value, ttl, time.monotonic())
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add_many(self, keys: Sequence[str], ttl: Optional[float] = None) -> List[bool]:
+        now = time.monotonic()
+        out: List[bool] = []
+        with self._lock:
+            for k in keys:
+                new = self._live(k, now) is None
+                if new:
+                    self._put(k, "1", ttl, now)
+                out.append(new)
+        return out
+
+    def incr_many(self, keys: Sequence[Tuple[str, float]]) -> List[int]:
+        now = time.monotonic()
+        out: List[int] = []
+        with self._lock:
+            for k, ttl in keys:
+                item = self._live(k, now)
+                if item is None:
+                    self._data[k] = ("1", now + ttl)
+                    out.append(1)
+                else:
+                    n = int(item[0]) + 1
+                    self._data[k] = (str(n), item[1])
+                    out.append(n)
+        return out
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            item = self._live(key, now)
+            if item is not None and item[0] != owner:
+                return False
+            self._put(key, owner, ttl, now)
+            return True
+
+    def release_lease(self, key: str, owner: str) -> None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] == owner:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "size": len(self._data), "evictions": self.evictions}
+
+# ==== sqlite (WAL) ====
+
+class SqliteBackend(StateBackend):
+    """عدة عمليات على نفس الجهاز: WAL يسمح بقراءات متوازية، وكل دفعة كتابة في transaction واحدة."""
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+        self._writes = 0
+
+    def _tx(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(time.time())
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._db.execute("DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            return out
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key=? AND (expires IS NULL OR expires > ?)",
+                                   (key, time.time())).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._tx(lambda now: self._db.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                                              (key, value, now + ttl if ttl else None)))
+
+    def delete(self, key: str) -> None:
+        self._tx(lambda now: self._db.execute("DELETE FROM state WHERE key=?", (key,)))
+
+    def add_many(self, keys: Sequence[str], ttl: Optional[float] = None) -> List[bool]:
+        def run(now: float) -> List[bool]:
+            out = []
+            for k in keys:
+                # إدراج، أو استبدال مفتاح منتهي؛ changes()=0 يعني أنه موجود وحي
+                cur = self._db.execute(
+                    "INSERT INTO state VALUES (?, '1', ?) ON CONFLICT(key) DO UPDATE SET value='1', "
+                    "expires=excluded.expires WHERE state.expires IS NOT NULL AND state.expires <= ?",
+                    (k, now + ttl if ttl else None, now))
+                out.append(cur.rowcount > 0)
+            return out
+        return self._tx(run)
+
+    def incr_many(self, keys: Sequence[Tuple[str, float]]) -> List[int]:
+        def run(now: float) -> List[int]:
+            out = []
+            for k, ttl in keys:
+                row = self._db.execute(
+                    "INSERT INTO state VALUES (?, '1', ?) ON CONFLICT(key) DO UPDATE SET "
+                    "value = CASE WHEN state.expires <= ? THEN '1' ELSE CAST(state.value AS INTEGER) + 1 END, "
+                    "expires = CASE WHEN state.expires <= ? THEN excluded.expires ELSE state.expires END "
+                    "RETURNING value", (k, now + ttl, now, now)).fetchone()
+                out.append(int(row[0]))
+            return out
+        return self._tx(run)
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        def run(now: float) -> bool:
+            cur = self._db.execute(
+                "INSERT INTO state VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value, "
+                "expires=excluded.expires WHERE state.value = excluded.value OR state.expires <= ?",
+                (key, owner, now + ttl, now))
+            return cur.rowcount > 0
+        return self._tx(run)
+
+    def release_lease(self, key: str, owner: str) -> None:
+        self._tx(lambda now: self._db.execute("DELETE FROM state WHERE key=? AND value=?", (key, owner)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+# ==== redis (RESP2) ====
+
+class RedisReplyError(StateError):
+    pass
+
+class RespConnection:
+    """اتصال واحد بخادم Redis (أو أي خادم يتكلم RESP)؛ pipeline = كتابة كل الأوامر ثم قراءة كل الردود."""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: float = STATE_TIMEOUT):
+        self.host, self.port, self.db, self.password, self.timeout = host, port, db, password, timeout
+        self._sock: Optional[socket.socket] = None
+        self._buf = b""
+
+    @staticmethod
+    def encode(args: Sequence[Union[str, bytes, int, float]]) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            b = a if isinstance(a, bytes) else str(a).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = b""
+        hello: List[List[Any]] = []
+        if self.password:
+            hello.append(["AUTH", self.password])
+        if self.db:
+            hello.append(["SELECT", self.db])
+        if hello:
+            for r in self._roundtrip(hello):
+                if isinstance(r, RedisReplyError):
+                    raise r
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def _line(self) -> bytes:
+        while b"\r\n" not in self._buf:
+            self._fill()
+        line, self._buf = self._buf.split(b"\r\n", 1)
+        return line
+
+    def _fill(self) -> None:
+        chunk = self._sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("redis connection closed")
+        self._buf += chunk
+
+    def _read(self) -> Any:
+        line = self._line()
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisReplyError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            while len(self._buf) < n + 2:
+                self._fill()
+            data, self._buf = self._buf[:n], self._buf[n + 2:]
+            return data.decode("utf-8")
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise StateError(f"bad RESP reply: {line[:40]!r}")
+
+    def _roundtrip(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        self._sock.sendall(b"".join(self.encode(c) for c in commands))
+        return [self._read() for _ in commands]
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        # إعادة اتصال مرة واحدة إذا انقطع الاتصال القديم (مثلًا بعد idle timeout)
+        for attempt in (0, 1):
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._roundtrip(commands)
+            except (OSError, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+        return []
+
+class RedisBackend(StateBackend):
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, prefix: str = STATE_PREFIX):
+        u = urlparse(url)
+        db = int((u.path or "/0").strip("/") or 0)
+        self.prefix = prefix
+        self.conn = RespConnection(u.hostname or "127.0.0.1", u.port or 6379, db, u.password)
+        self._lock = threading.Lock()
+        self.roundtrips = 0
+
+    def _k(self, key: str) -> str:
+        return self.prefix + key
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        with self._lock:
+            self.roundtrips += 1
+            replies = self.conn.pipeline(commands)
+        for r in replies:
+            if isinstance(r, RedisReplyError):
+                raise r
+        return replies
+
+    def get(self, key: str) -> Optional[str]:
+        return self.pipeline([["GET", self._k(key)]])[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        cmd: List[Any] = ["SET", self._k(key), value]
+        if ttl:
+            cmd += ["PX", int(ttl * 1000)]
+        self.pipeline([cmd])
+
+    def delete(self, key: str) -> None:
+        self.pipeline([["DEL", self._k(key)]])
+
+    def add_many(self, keys: Sequence[str], ttl: Optional[float] = None) -> List[bool]:
+        if not keys:
+            return []
+        px = ["PX", int(ttl * 1000)] if ttl else []
+        return [r == "OK" for r in self.pipeline([["SET", self._k(k), "1", "NX", *px] for k in keys])]
+
+    def incr_many(self, keys: Sequence[Tuple[str, float]]) -> List[int]:
+        if not keys:
+            return []
+        cmds: List[List[Any]] = []
+        for k, ttl in keys:
+            # SET NX ينشئ العدّاد بمدته مرة واحدة (نافذة ثابتة) و INCR يحافظ على المدة؛
+            # بدل PEXPIRE ... NX الذي يحتاج Redis 7 (هذا يعمل منذ 2.6.12)
+            cmds += [["SET", self._k(k), "0", "PX", int(ttl * 1000), "NX"], ["INCR", self._k(k)]]
+        return self.pipeline(cmds)[1::2]
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        ok, current = self.pipeline([["SET", self._k(key), owner, "NX", "PX", int(ttl * 1000)],
+                                     ["GET", self._k(key)]])
+        if ok == "OK":
+            return True
+        if current == owner:  # تجديد قفل نملكه
+            self.pipeline([["PEXPIRE", self._k(key), int(ttl * 1000)]])
+            return True
+        return False
+
+    def release_lease(self, key: str, owner: str) -> None:
+        # GET ثم DEL (بدون Lua): نافذة سباق صغيرة مقبولة لأن القفل ينتهي وحده على أي حال
+        if self.get(key) == owner:
+            self.delete(key)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "roundtrips": self.roundtrips}
+
+# ==== الاختيار من البيئة ====
+
+def from_url(url: str) -> StateBackend:
+    if url in ("", "memory", "memory://"):
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        if url.startswith("rediss://"):
+            raise StateError("TLS redis (rediss://) is not supported; use a local TLS tunnel")
+        return RedisBackend(url)
+    raise StateError(f"unknown STATE_BACKEND '{url}'")
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> StateBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            try:
+                _backend = from_url(STATE_BACKEND)
+            except (StateError, sqlite3.Error) as e:
+                logger.warning(f"[state] {e}; falling back to in-memory state")
+                _backend = MemoryBackend()
+        return _backend
+
+async def run(backend: StateBackend, method: str, *args: Any) -> Any:
+    """نداء backend من داخل الـ event loop: الذاكرة مباشرة، والمشترك في thread مع guarded()."""
+    if not backend.shared:
+        return getattr(backend, method)(*args)
+    return await asyncio.to_thread(backend.guarded, method, *args)
+
+class SharedStore:
+    """
+    عرض بمفتاح مسبوق و TTL ثابت بنفس واجهة SqliteStore (get/set/delete): طبقة ثانية مشتركة للكاش.
+    طبقة اختيارية: backend معطل = miss (get يعيد None و set/delete لا تفعل شيئًا).
+    """
+
+    def __init__(self, backend: StateBackend, namespace: str, ttl: Optional[float] = None):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _call(self, method: str, *args: Any) -> Any:
+        try:
+            return self.backend.guarded(method, *args)
+        except BACKEND_ERRORS:
+            return None
+
+    def get(self, key: str) -> Optional[str]:
+        return self._call("get", f"{self.namespace}:{key}")
+
+    def set(self, key: str, value: str) -> None:
+        self._call("set", f"{self.namespace}:{key}", value, self.ttl)
+
+    def delete(self, key: str) -> None:
+        self._call("delete", f"{self.namespace}:{key}")
+
+def shared_store(namespace: str, ttl: Optional[float] = None) -> Optional[SharedStore]:
+    """None إذا الحالة محلية (memory): الكاش في الذاكرة يكفي."""
+    backend = get_backend()
+    return SharedStore(backend, namespace, ttl) if backend.shared else None
@@ -1,21 +1,25 @@
 from __future__ import annotations
-import os, httpx, json
+import os
+
+from . import net
 
 TG = os.getenv("TG_BOT_TOKEN","")
 CHAT = os.getenv("TELEGRAM_CHAT_ID","")
+TG_API_URL = os.getenv("TG_API_URL", "https://api.telegram.org").rstrip("/")  # قابل للتغيير لخادم Bot API محلي/وهمي
+
+def api_url(token: str, method: str) -> str:
+    return f"{TG_API_URL}/bot{token}/{method}"
 
 def send_text(text: str, chat_id: str|None=None):
     if not TG or not (chat_id or CHAT): 
         return
-    url = f"https://api.telegram.org/bot{TG}/sendMessage"
-    with httpx.Client(timeout=20) as c:
-        c.post(url, data={"chat_id": chat_id or CHAT, "text": text})
+    url = api_url(TG, "sendMessage")
+    net.get_sync_client().post(url, data={"chat_id": chat_id or CHAT, "text": text}, timeout=20)
 
 def send_document(bytes_data: bytes, filename: str, caption: str = "", chat_id: str|None=None):
     if not TG or not (chat_id or CHAT): 
         return
-    url = f"https://api.telegram.org/bot{TG}/sendDocument"
+    url = api_url(TG, "sendDocument")
     files = {"document": (filename, bytes_data, "application/json")}
     data = {"chat_id": chat_id or CHAT, "caption": caption}
-    with httpx.Client(timeout=60) as c:
-        c.post(url, data=data, files=files)
+    net.get_sync_client().post(url, data=data, files=files, timeout=60)
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from pydantic import BaseModel, field_validator
-from typing import Dict, Any
-import json
+from typing import Dict, Any, List, Optional
+
+from . import serde
 
 class LLMEnvelope(BaseModel):
     """نطلب من الـ LLM يعيد JSON داخل هذا الظرف للحماية من الخروج النصّي."""
@@ -14,13 +15,250 @@ class LLMEnvelope(BaseModel):
             raise ValueError("Invalid plan format")
         return v
 
+class PlanStreamParser:
+    """
+    محلّل تدريجي متوازن الأقواس لنص الـ LLM أثناء وصوله (stream).
+    يتجاهل أي نص قبل أول { ، ويعيد {"plan": ...} بمجرد إغلاق كائن plan في المستوى الأعلى،
+    بدون انتظار بقية الرد.
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._i = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._plan_start: Optional[int] = None
+        self._top_start: Optional[int] = None
+        self.result: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def restart(self) -> "PlanStreamParser":
+        """
+        محلل جديد من أول { بعد بداية الكائن الأعلى الحالي: بعد قوس داخل نص ("{example}") أو كائن بلا plan،
+        فتبقى الخطة التي تأتي بعده قابلة للالتقاط أثناء الـ stream.
+        """
+        nxt = PlanStreamParser()
+        start = -1 if self._top_start is None else self._text.find("{", self._top_start + 1)
+        if start != -1:
+            nxt._text = self._text[start:]  # يُفحص مع feed() التالي
+        return nxt
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        if self.result is not None:
+            return self.result
+        self._text += chunk
+        text, i, n = self._text, self._i, len(self._text)
+        while i < n:
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = text[self._str_start + 1:i]
+            elif self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._top_start = i
+                    self._expect_key = True
+            elif c == '"':
+                self._in_str = True
+                self._str_start = i
+            elif c in "{[":
+                if self._depth == 1 and c == "{" and not self._expect_key and self._key == "plan":
+                    self._plan_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._plan_start is not None:
+                    plan = serde.loads(text[self._plan_start:i + 1])
+                    self.result = {"plan": plan}
+                    self._i = i + 1
+                    return self.result
+                if self._depth == 0:
+                    # أُغلق الكائن الأعلى بدون plan: نرجعه كما هو ليفشل التحقق برسالة واضحة
+                    self.result = serde.loads(text[self._top_start:i + 1])
+                    self._i = i + 1
+                    return self.result
+            elif self._depth == 1:
+                if c == ":":
+                    self._expect_key = False
+                elif c == ",":
+                    self._expect_key = True
+                    self._key = None
+            i += 1
+        self._i = i
+        return None
+
 def coerce_json(text: str) -> Dict[str, Any]:
-    """يحاول استخراج JSON من نص الـ LLM بأمان."""
+    """يحاول استخراج JSON من نص الـ LLM بأمان (حتى لو سبقه نص فيه أقواس مثل "{example}")."""
+    first: Optional[Dict[str, Any]] = None
+    start = text.find("{")
+    while start != -1:
+        try:
+            parsed = PlanStreamParser().feed(text[start:])
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            if "plan" in parsed:
+                return parsed
+            first = first or parsed
+        start = text.find("{", start + 1)
+    if first is not None:
+        return first
     # أبسط محاولة قوية: ابحث عن أول { وآخر } وجرّب
     try:
         start = text.index("{")
         end = text.rindex("}")
         payload = text[start:end+1]
-        return json.loads(payload)
+        return serde.loads(payload)
     except Exception:
         raise ValueError("LLM did not return valid JSON")
+
+# ==== فحص بنية الخطة كرسم بياني (O(V+E)) ====
+
+STEP_TYPES = frozenset(("cron", "webhook", "http", "set", "if", "wait", "telegram"))
+TRIGGER_TYPES = frozenset(("cron", "webhook"))
+
+class PlanError(BaseModel):
+    """خطأ بنيوي واحد؛ نرسل القائمة للـ LLM في جولة إصلاح."""
+    code: str
+    message: str
+    step: Optional[str] = None
+    edge: Optional[List[str]] = None
+
+def _as_dict(plan: Any) -> Dict[str, Any]:
+    if isinstance(plan, BaseModel):
+        return plan.model_dump(by_alias=True)
+    return plan if isinstance(plan, dict) else {}
+
+def validate_plan(plan: Any) -> List[PlanError]:
+    """
+    يبني فهرس مجاورة واحد ثم يفحص: ids مكررة، أنواع مجهولة، حواف بأطراف غير موجودة،
+    فروع if لخطوات مجهولة، أكثر من trigger، حلقات، وخطوات لا يصلها الـ trigger.
+    """
+    plan = _as_dict(plan)
+    errors: List[PlanError] = []
+    steps = plan.get("steps")
+    edges = plan.get("edges")
+    if not isinstance(steps, list) or not isinstance(edges, list):
+        return [PlanError(code="bad_format", message="plan.steps and plan.edges must be lists")]
+
+    adj: Dict[str, List[str]] = {}
+    indeg: Dict[str, int] = {}
+    triggers: List[str] = []
+    branches: List[tuple] = []
+    for s in steps:
+        sid = s.get("id") if isinstance(s, dict) else None
+        if not isinstance(sid, str) or not sid:
+            errors.append(PlanError(code="missing_id", message="every step needs a string id"))
+            continue
+        if sid in adj:
+            errors.append(PlanError(code="duplicate_id", message=f"step id '{sid}' is used more than once", step=sid))
+            continue
+        adj[sid] = []
+        indeg[sid] = 0
+        stype = s.get("type")
+        params = s.get("params")
+        if params is not None and not isinstance(params, dict):
+            errors.append(PlanError(code="bad_format", step=sid,
+                                    message=f"step '{sid}' params must be an object, got {type(params).__name__}"))
+            params = None
+        if not isinstance(stype, str):
+            errors.append(PlanError(code="bad_format", step=sid,
+                                    message=f"step '{sid}' type must be a string, got {type(stype).__name__}"))
+        elif stype not in STEP_TYPES:
+            errors.append(PlanError(code="unknown_type", message=f"step '{sid}' has unknown type '{stype}'", step=sid))
+        elif stype in TRIGGER_TYPES:
+            triggers.append(sid)
+        elif stype == "if" and params:
+            for k in ("then", "else"):
+                target = params.get(k)
+                if not target:
+                    continue
+                if isinstance(target, str):
+                    branches.append((sid, k, target))
+                else:
+                    errors.append(PlanError(code="bad_format", step=sid,
+                                            message=f"if step '{sid}' {k} must be a step id string"))
+
+    if len(triggers) > 1:
+        errors.append(PlanError(code="multiple_triggers",
+                                message=f"plan has {len(triggers)} triggers ({', '.join(triggers)}); keep exactly one"))
+
+    seen_links: set = set()
+
+    def link(a: str, b: str) -> None:
+        if (a, b) not in seen_links:
+            seen_links.add((a, b))
+            adj[a].append(b)
+            indeg[b] += 1
+
+    for e in edges:
+        a = e.get("from", e.get("from_")) if isinstance(e, dict) else None
+        b = e.get("to") if isinstance(e, dict) else None
+        if any(x is not None and not isinstance(x, str) for x in (a, b)):
+            errors.append(PlanError(code="bad_format", edge=[str(a), str(b)],
+                                    message="edge endpoints must be step id strings"))
+            continue
+        missing = [x for x in (a, b) if x not in adj]
+        if missing:
+            errors.append(PlanError(code="dangling_edge", edge=[str(a), str(b)],
+                                    message=f"edge {a} → {b} references unknown step(s): {', '.join(map(str, missing))}"))
+            continue
+        link(a, b)
+
+    for sid, key, target in branches:
+        if target not in adj:
+            errors.append(PlanError(code="unknown_branch", step=sid,
+                                    message=f"if step '{sid}' {key} branch points at unknown step '{target}'"))
+        else:
+            link(sid, target)
+
+    for t in triggers:
+        if indeg[t]:
+            errors.append(PlanError(code="trigger_has_input", step=t,
+                                    message=f"trigger '{t}' must not have incoming edges"))
+
+    # Kahn: ما يتبقى بعد إزالة العقد بدون مدخلات يقع على حلقة أو بعدها
+    remaining = dict(indeg)
+    queue = [sid for sid, d in remaining.items() if d == 0]
+    visited = 0
+    while queue:
+        sid = queue.pop()
+        visited += 1
+        for nxt in adj[sid]:
+            remaining[nxt] -= 1
+            if remaining[nxt] == 0:
+                queue.append(nxt)
+    if visited < len(adj):
+        cyclic = [sid for sid, d in remaining.items() if d > 0]
+        errors.append(PlanError(code="cycle", message=f"steps form a cycle: {', '.join(cyclic[:20])}",
+                                step=cyclic[0]))
+
+    if triggers:
+        reached = set(triggers)
+        stack = list(triggers)
+        while stack:
+            for nxt in adj[stack.pop()]:
+                if nxt not in reached:
+                    reached.add(nxt)
+                    stack.append(nxt)
+        for sid in adj:
+            if sid not in reached:
+                errors.append(PlanError(code="unreachable", step=sid,
+                                        message=f"step '{sid}' is not reachable from the trigger"))
+    return errors
+
+def validate_many(plans: List[Any]) -> List[List[PlanError]]:
+    return [validate_plan(p) for p in plans]
@@ -0,0 +1,71 @@
+"""
+قياس تحليل الوصف: المرور الواحد (app.analyze) مقابل المسح الثلاثي القديم في generator.py.
+
+    python -m bench.analyze [--rounds 2000]
+"""
+from __future__ import annotations
+import argparse, re, time
+
+from app.analyze import SCHEDULE_KEYWORDS, TELEGRAM_WORDS, WEEKDAYS, analyze
+from bench.corpus import PROMPTS
+
+# ==== المسح القديم (generator.py قبل app.analyze) للمقارنة ====
+
+def _old_parse_time(prompt: str):
+    m = re.search(r"(\d{1,2})\s*[:：]\s*(\d{2})", prompt)
+    if m:
+        return max(0, min(23, int(m.group(1)))), max(0, min(59, int(m.group(2))))
+    m = re.search(r"الساعة\s+(\d{1,2})", prompt)
+    if m:
+        return max(0, min(23, int(m.group(1)))), 0
+    return 9, 0
+
+def _old_needs_schedule(prompt: str) -> bool:
+    return any(k in prompt for k in ["كل يوم", "كل يومٍ", "every day", "كل ساعة", "weekly", "كل اسبوع", "كل أسبوع"])
+
+def _old_url(prompt: str) -> str:
+    m = re.search(r"https?://[^\s]+", prompt)
+    return m.group(0) if m else "https://httpbin.org/anything"
+
+def old_scan(prompt: str):
+    return _old_needs_schedule(prompt), _old_parse_time(prompt), _old_url(prompt)
+
+# ==== نفس ميزات app.analyze لكن بمسح منفصل لكل ميزة (مرجع عادل) ====
+
+_RX = [re.compile(p, re.I) for p in (
+    r"https?://[^\s]+", r"(\d{1,2})\s*[:：]\s*(\d{2})", r"الساعة\s+(\d{1,2})",
+    r"(?:every|كل)\s+(\d{1,3})\s*(minutes?|mins?|دقائق|دقيقة|hours?|ساعات|ساعة)",
+)]
+
+def multi_scan(prompt: str):
+    low = prompt.lower()
+    found = [rx.search(prompt) for rx in _RX]
+    kw = [k for k in SCHEDULE_KEYWORDS if k in low]
+    day = [d for d in WEEKDAYS if d in low]
+    tg = any(w in low for w in TELEGRAM_WORDS)
+    return found, kw, day, tg
+
+def _rate(fn, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for p in PROMPTS:
+            fn(p)
+    return rounds * len(PROMPTS) / (time.perf_counter() - t0)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=2000)
+    args = ap.parse_args()
+
+    old = _rate(old_scan, args.rounds)
+    multi = _rate(multi_scan, args.rounds)
+    new = _rate(analyze, args.rounds)
+    print(f"three scans (old)  : {old:>10,.0f} prompts/s  (schedule + time + url only)")
+    print(f"scan per feature   : {multi:>10,.0f} prompts/s  (same features as single pass)")
+    print(f"single pass        : {new:>10,.0f} prompts/s  (time, url, intervals, weekdays, telegram)")
+    detected_old = sum(old_scan(p)[0] for p in PROMPTS)
+    detected_new = sum(analyze(p).scheduled for p in PROMPTS)
+    print(f"scheduled detected : old {detected_old}/{len(PROMPTS)}, new {detected_new}/{len(PROMPTS)}")
+
+if __name__ == "__main__":
+    main()
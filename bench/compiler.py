@@ -0,0 +1,37 @@
+"""
+قياس مترجم Plan → n8n على خطط اصطناعية كبيرة ودفعات من خطط صغيرة.
+
+    python -m bench.compiler [--sizes 1000,5000,10000] [--batch 2000]
+"""
+from __future__ import annotations
+import argparse, time
+
+from app.compiler import compile_many, compile_plan
+from app.spec import Plan
+from bench.synthetic import synthetic_plan
+
+def _best(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,5000,10000")
+    ap.add_argument("--batch", type=int, default=2000)
+    args = ap.parse_args()
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        plan = Plan.model_validate(synthetic_plan(n))
+        dt = _best(lambda: compile_plan(plan))
+        print(f"compile {n:>6} steps : {dt * 1000:8.2f} ms  ({n / dt:,.0f} steps/s)")
+
+    small = [Plan.model_validate(synthetic_plan(6, seed=i)) for i in range(args.batch)]
+    dt = _best(lambda: compile_many(small))
+    print(f"batch {args.batch} x 6 steps : {dt * 1000:8.2f} ms  ({args.batch / dt:,.0f} plans/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# عينة طلبات عربية/إنجليزية واقعية لقياس تحليل الوصف والمسار السريع.
+PROMPTS = [
+    "كل يوم الساعة 8:00 أرسل لي سعر البيتكوين على تيليغرام",
+    "كل يوم على 08:30 جيب سعر الذهب من https://api.metals.live/v1/spot وابعثه لي في تلغرام",
+    "كل ساعة افحص الموقع https://example.com وإذا كان معطل نبهني",
+    "كل 5 دقائق راقب حالة https://status.example.org/health",
+    "كل أسبوع يوم الاثنين الساعة 9 أرسل تقرير المبيعات",
+    "اصنع فيديو بالذكاء الاصطناعي عن القطط وأرسل المخطط على تيليغرام",
+    "أريد أتمتة ترسل رسالة ترحيب عند استقبال webhook",
+    "يومياً الساعة ٧:١٥ اجلب الطقس من https://wttr.in/Algiers?format=j1",
+    "Every day at 7:45 fetch https://api.coindesk.com/v1/bpi.json and send the price to Telegram",
+    "every 10 minutes check https://myapp.example.com/health and alert me on telegram if it is down",
+    "Send me a weekly summary every Friday at 18:00",
+    "hourly: pull new rows from https://sheets.example.com/export.csv",
+    "Make an AI video outline about space and post it to Telegram daily",
+    "when a webhook is received, wait 10 seconds then call https://hooks.example.com/notify",
+    "monitor https://shop.example.com every 5 minutes and notify me",
+    "just fetch https://httpbin.org/json once",
+    "كل صباح الساعة 6:00 ذكرني بشرب الماء",
+    "راقب الرابط https://api.github.com/status كل 15 دقيقة",
+    "every morning summarize the news from https://news.ycombinator.com/rss",
+    "مرحبا",
+]
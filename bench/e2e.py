@@ -0,0 +1,240 @@
+"""
+اختبار حمل من طرف لطرف: app.main:app داخل نفس العملية، و Bot API و OpenRouter وهميان محليان
+(زمن استجابة ونسب أخطاء و 429 قابلة للضبط)، وتحديثات webhook اصطناعية بمعدل ثابت (open-loop).
+لكل سيناريو: الإنتاجية، p50/p95/p99 لزمن رد الـ webhook وللزمن حتى وصول ملف الـ workflow،
+أقصى ذاكرة (RSS)، وعدد النداءات الخارجية. النتائج تُكتب JSON للمقارنة بين التشغيلات.
+
+    python -m bench.e2e                                  # كل السيناريوهات
+    python -m bench.e2e -s templates -s llm --duration 10 --rate-scale 2
+    python -m bench.e2e --baseline bench_results/e2e-old.json
+"""
+from __future__ import annotations
+import os, sys, time, random, asyncio, argparse, logging, platform, resource, subprocess, tempfile
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from app import serde
+from bench.corpus import PROMPTS
+from bench.stubs import StubLLM, StubServer, StubTelegram
+
+class Scenario(NamedTuple):
+    name: str
+    rate: float                 # تحديثات/ثانية
+    template_share: float = 1.0  # نسبة الطلبات التي تطابق قالبًا جاهزًا (الباقي نص حر)
+    llm: bool = False           # نص حر → LLM (وإلا الخطة الافتراضية)
+    tg_latency: float = 0.02
+    tg_error_rate: float = 0.0
+    tg_429_rate: float = 0.0
+    llm_latency: float = 0.3
+    llm_error_rate: float = 0.0
+    journal: bool = False
+    duration: Optional[float] = None  # None = --duration
+
+SCENARIOS = [
+    Scenario("templates", rate=20),
+    Scenario("default-plan", rate=20, template_share=0.0),
+    Scenario("llm", rate=10, template_share=0.3, llm=True),
+    Scenario("llm-errors", rate=10, template_share=0.0, llm=True, llm_error_rate=0.2),
+    Scenario("tg-faults", rate=20, tg_error_rate=0.02, tg_429_rate=0.05),
+    Scenario("journal", rate=20, journal=True),
+    Scenario("burst", rate=100, duration=2.0),
+]
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)  # ms
+
+def _latency(values: List[float]) -> Dict[str, Optional[float]]:
+    return {"p50_ms": _pct(values, 0.5), "p95_ms": _pct(values, 0.95), "p99_ms": _pct(values, 0.99),
+            "max_ms": _pct(values, 1.0)}
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:  # غير Linux: أقصى قيمة منذ بدء العملية
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Harness:
+    def __init__(self, tg: StubTelegram, llm_stub: StubLLM):
+        self.tg = tg
+        self.llm_stub = llm_stub
+        from app import main
+        self.main = main
+        router = main.router
+        self.templates = [p for p in PROMPTS if router.match(p) is not None]
+        self.free = [p for p in PROMPTS if router.match(p) is None]
+        self.update_id = 0
+        self.chat_id = 10_000
+
+    def _configure(self, sc: Scenario) -> None:
+        from app import llm, state
+        from app.journal import JobJournal
+        from app.plan_cache import PlanCache
+        from app.ratelimit import RateLimiter
+        self.tg.latency, self.tg.error_rate, self.tg.rate_429 = sc.tg_latency, sc.tg_error_rate, sc.tg_429_rate
+        self.llm_stub.latency, self.llm_stub.error_rate = sc.llm_latency, sc.llm_error_rate
+        llm.OPENROUTER_API_KEY = "bench" if sc.llm else ""
+        llm.plan_cache = PlanCache(namespace=f"bench-{sc.name}")  # كل سيناريو يبدأ بكاش فارغ
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-journal-"), "jobs.sqlite") if sc.journal else ""
+        self.main.journal = JobJournal(path)
+        self.main.limiter = RateLimiter(backend=state.get_backend())  # دلاء وعدادات جديدة لكل سيناريو
+
+    def _update(self, rnd: random.Random, sc: Scenario) -> Dict[str, Any]:
+        self.update_id += 1
+        self.chat_id += 1  # محادثة لكل طلب: زمن التسليم يُقاس لكل chat_id
+        if rnd.random() < sc.template_share:
+            text = rnd.choice(self.templates)
+        else:
+            text = f"{rnd.choice(self.free)} #{self.update_id}"  # نص فريد: لا إصابات في كاش الخطط
+        return {"update_id": self.update_id,
+                "message": {"message_id": self.update_id, "date": int(time.time()),
+                            "chat": {"id": self.chat_id, "type": "private"},
+                            "from": {"id": self.chat_id, "first_name": "bench"}, "text": text}}
+
+    async def run(self, sc: Scenario, duration: float, seed: int, settle: float) -> Dict[str, Any]:
+        self._configure(sc)
+        main = self.main
+        rnd = random.Random(seed)
+        n = max(1, int(sc.rate * (sc.duration or duration)))
+        calls0, llm0 = dict(self.tg.calls), self.llm_stub.calls
+        errors0, throttled0 = self.tg.errors, self.tg.throttled
+        posted: Dict[int, float] = {}
+        acks: List[float] = []
+        replies = {"accepted": 0, "busy": 0, "other": 0}
+        peak = [_rss_mb()]
+        done = asyncio.Event()
+
+        async def sample_memory() -> None:
+            while not done.is_set():
+                peak[0] = max(peak[0], _rss_mb())
+                await asyncio.sleep(0.05)
+
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+                async def post(update: Dict[str, Any]) -> None:
+                    t = time.perf_counter()
+                    posted[update["message"]["chat"]["id"]] = t
+                    r = await client.post("/telegram", content=serde.dumps(update),
+                                          headers={"content-type": "application/json"})
+                    acks.append(time.perf_counter() - t)
+                    text = r.json().get("text") or ""
+                    key = "accepted" if "استلمت طلبك" in text else "busy" if "مشغول" in text else "other"
+                    replies[key] += 1
+
+                sampler = asyncio.create_task(sample_memory())
+                t0 = time.perf_counter()
+                tasks = []
+                for i in range(n):
+                    # open-loop: الإرسال حسب الجدول بغض النظر عن سرعة الرد
+                    delay = t0 + i / sc.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(post(self._update(rnd, sc))))
+                await asyncio.gather(*tasks)
+                sent_s = time.perf_counter() - t0
+                deadline = time.perf_counter() + settle
+                while (main.scheduler.depth or main.limiter.depth) and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.02)
+                drained = not (main.scheduler.depth or main.limiter.depth)
+                done.set()
+                await sampler
+            journal = main.journal.stats()
+
+        delivered = {c: self.tg.delivered[c] - t for c, t in posted.items() if c in self.tg.delivered}
+        last = max((self.tg.delivered[c] for c in delivered), default=t0)
+        calls = {m: c - calls0.get(m, 0) for m, c in self.tg.calls.items() if c - calls0.get(m, 0)}
+        return {
+            "scenario": sc._asdict(),
+            "updates": n,
+            "offered_rate": round(n / sent_s, 2),
+            "replies": replies,
+            "delivered": len(delivered),
+            "delivered_ratio": round(len(delivered) / n, 4),
+            "throughput_per_s": round(len(delivered) / (last - t0), 2) if delivered and last > t0 else 0.0,
+            "drained": drained,
+            "webhook_latency": _latency(acks),
+            "e2e_latency": _latency(list(delivered.values())),
+            "peak_rss_mb": round(peak[0], 1),
+            "outbound": {
+                "telegram": calls,
+                "telegram_errors_injected": self.tg.errors - errors0,
+                "telegram_429_injected": self.tg.throttled - throttled0,
+                "llm": self.llm_stub.calls - llm0,
+            },
+            "rate_limit": main.limiter.stats(),
+            **({"journal": journal} if sc.journal else {}),
+        }
+
+def _meta() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "serde": serde.BACKEND}
+
+def _print(result: Dict[str, Any], base: Optional[Dict[str, Any]]) -> None:
+    e2e, hook = result["e2e_latency"], result["webhook_latency"]
+    line = (f"{result['scenario']['name']:14s} {result['updates']:5d} upd  {result['throughput_per_s']:7.1f}/s  "
+            f"delivered {result['delivered_ratio']:6.1%}  e2e p50/p95/p99 {e2e['p50_ms']}/{e2e['p95_ms']}/{e2e['p99_ms']} ms  "
+            f"webhook p95 {hook['p95_ms']} ms  rss {result['peak_rss_mb']} MB")
+    if base is not None and base["e2e_latency"]["p95_ms"] and e2e["p95_ms"]:
+        line += f"  (p95 x{e2e['p95_ms'] / base['e2e_latency']['p95_ms']:.2f} vs baseline)"
+    print(line)
+
+async def _run_all(args: argparse.Namespace, scenarios: List[Scenario]) -> List[Dict[str, Any]]:
+    tg = StubTelegram(seed=args.seed)
+    llm_stub = StubLLM(seed=args.seed)
+    with StubServer(tg) as tg_url, StubServer(llm_stub) as llm_url:
+        # app.main يقرأ هذه القيم عند الاستيراد
+        os.environ.update({"TG_BOT_TOKEN": "BENCH", "TG_API_URL": tg_url, "TG_MODE": "webhook",
+                           "OPENROUTER_URL": f"{llm_url}/api/v1/chat/completions", "JOB_JOURNAL_PATH": ""})
+        harness = Harness(tg, llm_stub)
+        # app.main يضبط INFO عند الاستيراد؛ أخطاء الـ stubs المقصودة تظهر فقط مع --verbose
+        logging.getLogger().setLevel(logging.WARNING if args.verbose else logging.ERROR)
+        results = []
+        for i, sc in enumerate(scenarios):
+            results.append(await harness.run(sc._replace(rate=sc.rate * args.rate_scale), args.duration,
+                                             args.seed + i, args.settle))
+        return results
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m bench.e2e")
+    ap.add_argument("-s", "--scenario", action="append", choices=[s.name for s in SCENARIOS],
+                    help="run only these scenarios (repeatable)")
+    ap.add_argument("--duration", type=float, default=5.0, help="seconds of traffic per scenario")
+    ap.add_argument("--rate-scale", type=float, default=1.0, help="multiply every scenario's update rate")
+    ap.add_argument("--settle", type=float, default=30.0, help="max seconds to wait for queued jobs after the last update")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("-o", "--output", help="results JSON (default: bench_results/e2e-<time>.json)")
+    ap.add_argument("--baseline", help="previous results JSON to compare against")
+    ap.add_argument("-v", "--verbose", action="store_true", help="show the app's warnings (injected faults, 429 retries)")
+    args = ap.parse_args()
+
+    if "app.main" in sys.modules:
+        ap.error("bench.e2e must import app.main itself (after pointing it at the stubs)")
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            baseline = {r["scenario"]["name"]: r for r in serde.loads(f.read())["scenarios"]}
+
+    results = asyncio.run(_run_all(args, scenarios))
+    for r in results:
+        _print(r, baseline.get(r["scenario"]["name"]))
+
+    output = args.output or os.path.join("bench_results", f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(serde.dumps({"meta": _meta(), "args": vars(args), "scenarios": results}))
+    print(f"\nresults → {output}")
+
+if __name__ == "__main__":
+    main()
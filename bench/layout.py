@@ -0,0 +1,27 @@
+"""
+قياس توزيع العقد (Sugiyama) على DAGs اصطناعية: الزمن والتقاطعات قبل/بعد barycenter.
+
+    python -m bench.layout [--sizes 100,1000,5000]
+"""
+from __future__ import annotations
+import argparse, time
+
+from app.layout import count_crossings, layout, order_layers
+from bench.synthetic import random_dag
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,5000")
+    args = ap.parse_args()
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        nodes, links = random_dag(n)
+        t0 = time.perf_counter()
+        layout(nodes, links)
+        dt = time.perf_counter() - t0
+        before = count_crossings(*order_layers(nodes, links, sweeps=0))
+        after = count_crossings(*order_layers(nodes, links))
+        print(f"{n:>6} nodes {len(links):>6} edges : {dt * 1000:8.2f} ms   crossings {before} → {after}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+قياس المسار السريع: زمن تقييم الطلب في فهرس النوايا ونسبة الطلبات التي تُخدم بدون LLM.
+
+    python -m bench.router [--rounds 500]
+"""
+from __future__ import annotations
+import argparse, time
+
+from app.router import IntentRouter
+from bench.corpus import PROMPTS
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=500)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    router = IntentRouter()
+    print(f"index build       : {(time.perf_counter() - t0) * 1000:8.2f} ms")
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for p in PROMPTS:
+            router.index.score(p)
+    dt = time.perf_counter() - t0
+    print(f"score per prompt  : {dt / (args.rounds * len(PROMPTS)) * 1e6:8.1f} µs")
+
+    router = IntentRouter()
+    for p in PROMPTS:
+        router.route(p)
+    print(f"fast path on corpus: {router.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+قياس طبقة التسلسل (app/serde.py) على workflows واقعية من عينة الطلبات:
+json القياسي مقابل serde.dumps (orjson إن وُجد)، والمسار السريع كاملًا (ترجمة + تسلسل) مقابل الهياكل الجاهزة،
+وقراءة payloads الـ webhook.
+
+    python -m bench.serde [--rounds 2000]
+"""
+from __future__ import annotations
+import argparse, json, time
+from typing import Callable
+
+from app import serde
+from app.analyze import analyze
+from app.compiler import compile_plan
+from app.generator import plan_from_prompt
+from app.router import IntentRouter
+from bench.corpus import PROMPTS
+
+def _rate(label: str, n: int, items: int, fn: Callable[[], None]) -> float:
+    """fn تعالج items عنصرًا في كل نداء؛ الناتج لكل عنصر."""
+    fn()  # تسخين
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:34s}: {n * items / dt:10.0f} /s  ({dt / (n * items) * 1e6:7.1f} µs each)")
+    return dt
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=2000)
+    args = ap.parse_args()
+    print(f"backend: {serde.BACKEND}")
+
+    workflows = [compile_plan(plan_from_prompt(p, telegram=True)) for p in PROMPTS]
+    payload_size = sum(len(serde.dumps(w)) for w in workflows) / len(workflows)
+    print(f"\n{len(workflows)} workflows, avg {payload_size:.0f} bytes")
+
+    def std_dumps() -> None:
+        for w in workflows:
+            json.dumps(w, ensure_ascii=False).encode("utf-8")
+
+    def fast_dumps() -> None:
+        for w in workflows:
+            serde.dumps(w)
+
+    a = _rate("dumps  json.dumps+encode", args.rounds, len(workflows), std_dumps)
+    b = _rate("dumps  serde.dumps", args.rounds, len(workflows), fast_dumps)
+    print(f"{'speedup':34s}: {a / b:10.1f}x")
+
+    router = IntentRouter()
+    hits = [h for h in (router.match(p, analyze(p)) for p in PROMPTS) if h is not None]
+    skeletons = serde.SkeletonCache()
+    print(f"\n{len(hits)} template-routed prompts")
+
+    def rebuild() -> None:
+        for t, v in hits:
+            json.dumps(compile_plan(t.make(**v)), ensure_ascii=False).encode("utf-8")
+
+    def skeleton() -> None:
+        for t, v in hits:
+            skeletons.render(t.name, lambda m: compile_plan(t.make(**m)), v)
+
+    a = _rate("template  make+compile+json", args.rounds // 4, len(hits), rebuild)
+    b = _rate("template  skeleton fill", args.rounds // 4, len(hits), skeleton)
+    print(f"{'speedup':34s}: {a / b:10.1f}x")
+
+    updates = [json.dumps({"update_id": i, "message": {"message_id": i, "date": 1700000000,
+                                                       "chat": {"id": 1000 + i, "type": "private"},
+                                                       "from": {"id": 1000 + i, "first_name": "مستخدم"},
+                                                       "text": p}}, ensure_ascii=False).encode("utf-8")
+               for i, p in enumerate(PROMPTS)]
+
+    def std_loads() -> None:
+        for u in updates:
+            json.loads(u)
+
+    def fast_loads() -> None:
+        for u in updates:
+            serde.loads(u)
+
+    print(f"\n{len(updates)} webhook payloads")
+    a = _rate("loads  json.loads", args.rounds, len(updates), std_loads)
+    b = _rate("loads  serde.loads", args.rounds, len(updates), fast_loads)
+    print(f"{'speedup':34s}: {a / b:10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import asyncio, json, random, re, threading, time, socket
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+
+# خادم Bot API وهمي محلي للقياس: يرد على /bot<token>/<method> بنفس شكل Telegram.
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class StubTelegram:
+    """
+    ASGI app بسيط: يعدّ النداءات حسب الـ method ويرد {"ok": true}.
+    getUpdates يعيد التحديثات المضافة بـ push() (long-polling حتى timeout).
+    error_rate / rate_429: نسبة نداءات send* التي تفشل (500) أو تُرفض بـ 429 و retry_after.
+    delivered: chat_id → لحظة (perf_counter) أول sendDocument ناجح، لقياس الزمن من طرف لطرف.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_429: float = 0.0,
+                 retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rnd = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+        self.throttled = 0
+        self.delivered: Dict[int, float] = {}
+        self.updates: List[Dict[str, Any]] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def push(self, text: Optional[str], chat_id: int = 1) -> int:
+        """يضيف رسالة لطابور getUpdates (آمن من أي thread) ويعيد update_id."""
+        with self._lock:
+            uid = self._next_id
+            self._next_id += 1
+            msg: Dict[str, Any] = {"message_id": uid, "chat": {"id": chat_id, "type": "private"}, "date": int(time.time())}
+            if text is not None:
+                msg["text"] = text
+            self.updates.append({"update_id": uid, "message": msg})
+        return uid
+
+    async def _get_updates(self, req: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(req.get("offset") or 0)
+        limit = int(req.get("limit") or 100)
+        deadline = time.monotonic() + float(req.get("timeout") or 0)
+        while True:
+            with self._lock:
+                if offset:  # مثل Telegram: offset يؤكد استلام ما قبله
+                    self.updates = [u for u in self.updates if u["update_id"] >= offset]
+                batch = self.updates[:limit]
+            if batch or time.monotonic() >= deadline:
+                return batch
+            await asyncio.sleep(0.005)
+
+    _CHAT_ID = re.compile(rb'chat_id"(?:\s*:\s*|\r\n\r\n)(-?\d+)')  # JSON أو multipart
+
+    def _fault(self, method: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if not method.startswith("send"):
+            return None
+        r = self.rnd.random()
+        if r < self.rate_429:
+            self.throttled += 1
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry later",
+                         "parameters": {"retry_after": self.retry_after}}
+        if r < self.rate_429 + self.error_rate:
+            self.errors += 1
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        return None
+
+    def _result(self, method: str) -> Any:
+        if method == "sendDocument":
+            return {"message_id": 1, "document": {"file_id": "stub-file-id", "file_unique_id": "stub"}}
+        return {"message_id": 1}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        raw = b""
+        while True:
+            msg = await receive()
+            raw += msg.get("body", b"")
+            if not msg.get("more_body"):
+                break
+        method = scope["path"].rsplit("/", 1)[-1]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        status = 200
+        if method == "getUpdates":
+            reply: Dict[str, Any] = {"ok": True, "result": await self._get_updates(json.loads(raw or b"{}"))}
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            fault = self._fault(method)
+            if fault is not None:
+                status, reply = fault
+            else:
+                reply = {"ok": True, "result": self._result(method)}
+                m = self._CHAT_ID.search(raw) if method == "sendDocument" else None
+                if m is not None:
+                    self.delivered.setdefault(int(m.group(1)), time.perf_counter())
+        body = json.dumps(reply).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+STUB_PLAN = {
+    "plan": {
+        "name": "Daily price",
+        "timezone": "Africa/Algiers",
+        "steps": [
+            {"id": "cron", "type": "cron", "params": {"hour": 8, "minute": 0}},
+            {"id": "fetch", "type": "http", "params": {"method": "GET", "url": "https://httpbin.org/anything"}},
+            {"id": "fmt", "type": "set", "params": {"keepOnlySet": True,
+                                                    "values": {"string": [{"name": "msg", "value": "={{$json.url}}"}]}}},
+            {"id": "notify", "type": "telegram", "params": {"chatId": "={{$env.TELEGRAM_CHAT_ID}}", "text": "={{$json.msg}}"}},
+        ],
+        "edges": [{"from": "cron", "to": "fetch"}, {"from": "fetch", "to": "fmt"}, {"from": "fmt", "to": "notify"}],
+    }
+}
+
+class StubLLM:
+    """
+    OpenRouter وهمي: يرد بخطة ثابتة متبوعة بنص شرح طويل.
+    stream=true → SSE بأجزاء صغيرة كل chunk_delay ثانية؛ وإلا JSON كامل بعد latency.
+    error_rate: نسبة الطلبات التي ترد 500.
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_delay: float = 0.0, chunk_size: int = 16,
+                 trailing: int = 2000, plan: Optional[Dict[str, Any]] = None,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.errors = 0
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.content = json.dumps(plan or STUB_PLAN, ensure_ascii=False) + "\n\n" + "شرح إضافي. " * (trailing // 11)
+        self.calls = 0
+        self.chunks_sent = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        raw = b""
+        while True:
+            msg = await receive()
+            raw += msg.get("body", b"")
+            if not msg.get("more_body"):
+                break
+        self.calls += 1
+        req = json.loads(raw or b"{}")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rnd.random() < self.error_rate:
+            self.errors += 1
+            await send({"type": "http.response.start", "status": 500,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": b'{"error":{"message":"stub failure","code":500}}'})
+            return
+        if not req.get("stream"):
+            body = json.dumps({"choices": [{"message": {"role": "assistant", "content": self.content}}]}).encode()
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        try:
+            await send({"type": "http.response.body", "body": b": OPENROUTER PROCESSING\n\n", "more_body": True})
+            for i in range(0, len(self.content), self.chunk_size):
+                piece = self.content[i:i + self.chunk_size]
+                data = json.dumps({"choices": [{"delta": {"content": piece}}]}, ensure_ascii=False)
+                await send({"type": "http.response.body", "body": f"data: {data}\n\n".encode(), "more_body": True})
+                self.chunks_sent += 1
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+            if (req.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": len(json.dumps(req.get("messages", []))) // 4,
+                         "completion_tokens": len(self.content) // 4}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                data = json.dumps({"choices": [], "usage": usage})
+                await send({"type": "http.response.body", "body": f"data: {data}\n\n".encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+        except OSError:
+            pass  # العميل أغلق الاتصال مبكرًا (متوقع مع الـ streaming parser)
+
+class StubServer:
+    """يشغّل ASGI app على uvicorn في thread منفصل (with StubServer(app) as url: ...)."""
+
+    def __init__(self, asgi_app, port: Optional[int] = None):
+        self.app = asgi_app
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        cfg = uvicorn.Config(asgi_app, host="127.0.0.1", port=self.port, log_level="warning",
+                             access_log=False, lifespan="off")
+        self.server = uvicorn.Server(cfg)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("stub server did not start")
+            time.sleep(0.01)
+        return self.url
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+class StubRedis:
+    """
+    خادم RESP صغير في الذاكرة (بديل Redis للقياس والتجربة): PING/GET/SET [NX|XX] [EX|PX]/DEL/INCR/
+    PEXPIRE [NX]/PTTL/FLUSHDB/SELECT. with StubRedis() as url: → "redis://127.0.0.1:<port>/0".
+    """
+
+    def __init__(self, port: Optional[int] = None, version: int = 7):
+        self.port = port or _free_port()
+        self.version = version  # < 7: يرفض PEXPIRE ... NX مثل Redis 6
+        self.data: Dict[bytes, bytes] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.commands = 0
+        self._loop = asyncio.new_event_loop()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def _alive(self, key: bytes) -> bool:
+        exp = self.expires.get(key)
+        if exp is not None and exp <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, args: List[bytes]) -> bytes:
+        self.commands += 1
+        cmd = args[0].upper()
+        if cmd == b"PING":
+            return b"+PONG\r\n"
+        if cmd in (b"SELECT", b"AUTH"):
+            return b"+OK\r\n"
+        if cmd == b"FLUSHDB":
+            self.data.clear()
+            self.expires.clear()
+            return b"+OK\r\n"
+        key = args[1]
+        if cmd == b"GET":
+            return self._bulk(self.data[key] if self._alive(key) else None)
+        if cmd == b"SET":
+            opts = [a.upper() for a in args[3:]]
+            exists = self._alive(key)
+            if (b"NX" in opts and exists) or (b"XX" in opts and not exists):
+                return b"$-1\r\n"
+            self.data[key] = args[2]
+            self.expires.pop(key, None)
+            for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+                if unit in opts:
+                    self.expires[key] = time.monotonic() + int(args[3 + opts.index(unit) + 1]) * scale
+            return b"+OK\r\n"
+        if cmd == b"DEL":
+            n = sum(1 for k in args[1:] if self._alive(k) and self.data.pop(k) is not None)
+            return b":%d\r\n" % n
+        if cmd == b"INCR":
+            try:
+                value = int(self.data[key]) + 1 if self._alive(key) else 1
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            self.data[key] = str(value).encode()
+            return b":%d\r\n" % value
+        if cmd == b"PEXPIRE":
+            if self.version < 7 and len(args) > 3:
+                return b"-ERR wrong number of arguments for 'pexpire' command\r\n"
+            if not self._alive(key) or (b"NX" in [a.upper() for a in args[3:]] and key in self.expires):
+                return b":0\r\n"
+            self.expires[key] = time.monotonic() + int(args[2]) / 1000
+            return b":1\r\n"
+        if cmd == b"PTTL":
+            if not self._alive(key):
+                return b":-2\r\n"
+            exp = self.expires.get(key)
+            return b":-1\r\n" if exp is None else b":%d\r\n" % int((exp - time.monotonic()) * 1000)
+        return b"-ERR unknown command '%s'\r\n" % cmd
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    n = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(n + 2))[:-2])
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._client, "127.0.0.1", self.port), self._loop).result(10)
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def __exit__(self, *exc) -> None:
+        async def close() -> None:
+            self._server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.thread.join(timeout=5)
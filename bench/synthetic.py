@@ -0,0 +1,42 @@
+from __future__ import annotations
+import random
+from typing import Any, Dict, List
+
+# خطط اصطناعية للقياس: سلسلة خطوات مع فروع if (then/else) تندمج لاحقًا.
+
+_BODY_TYPES = ["http", "set", "wait", "telegram"]
+
+def synthetic_plan(n_steps: int, branch_every: int = 7, seed: int = 0) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    steps: List[Dict[str, Any]] = [{"id": "s0", "type": "cron", "params": {"hour": 8, "minute": 0}}]
+    edges: List[Dict[str, str]] = []
+    tails = ["s0"]
+    i = 1
+    while i < n_steps:
+        if i % branch_every == 0 and i + 2 < n_steps:
+            cond, yes, no = f"s{i}", f"s{i + 1}", f"s{i + 2}"
+            steps.append({"id": cond, "type": "if",
+                          "params": {"expression": "={{ $json.ok }}", "then": yes, "else": no}})
+            steps.append({"id": yes, "type": "http", "params": {"url": f"https://example.com/{i}"}})
+            steps.append({"id": no, "type": "set", "params": {}})
+            edges += [{"from": t, "to": cond} for t in tails]
+            tails = [yes, no]
+            i += 3
+            continue
+        sid = f"s{i}"
+        steps.append({"id": sid, "type": rnd.choice(_BODY_TYPES), "params": {}})
+        edges += [{"from": t, "to": sid} for t in tails]
+        tails = [sid]
+        i += 1
+    return {"name": f"synthetic-{n_steps}", "timezone": "UTC", "steps": steps, "edges": edges}
+
+def random_dag(n_nodes: int, fanout: int = 2, span: int = 8, seed: int = 0) -> tuple:
+    """DAG عشوائي: كل عقدة تتصل بـ fanout عقد لاحقة ضمن مدى span → (nodes, links)."""
+    rnd = random.Random(seed)
+    nodes = [f"n{i}" for i in range(n_nodes)]
+    links = []
+    for i in range(n_nodes - 1):
+        for k in range(rnd.randint(1, fanout)):
+            j = rnd.randint(i + 1, min(n_nodes - 1, i + span))
+            links.append((nodes[i], nodes[j], k % 2))
+    return nodes, links
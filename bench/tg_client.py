@@ -0,0 +1,55 @@
+"""
+مقارنة requests/s على Bot API وهمي: عميل جديد لكل نداء (القديم) مقابل العميل المشترك (app.net).
+
+    python -m bench.tg_client [--requests 2000] [--concurrency 50]
+"""
+from __future__ import annotations
+import argparse, asyncio, time
+
+import httpx
+
+from app import net
+from bench.stubs import StubServer, StubTelegram
+
+PAYLOAD = {"chat_id": 1, "text": "✅ استلمت طلبك", "parse_mode": "HTML"}
+
+async def _run(n: int, conc: int, call) -> float:
+    sem = asyncio.Semaphore(conc)
+
+    async def one():
+        async with sem:
+            await call()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    return n / (time.perf_counter() - t0)
+
+async def per_call_client(url: str, n: int, conc: int) -> float:
+    async def call():
+        async with httpx.AsyncClient(timeout=30) as client:
+            (await client.post(url, json=PAYLOAD)).json()
+    return await _run(n, conc, call)
+
+async def pooled_client(url: str, n: int, conc: int) -> float:
+    async def call():
+        (await net.get_async_client().post(url, json=PAYLOAD)).json()
+    try:
+        return await _run(n, conc, call)
+    finally:
+        await net.shutdown()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=50)
+    args = ap.parse_args()
+
+    with StubServer(StubTelegram()) as base:
+        url = f"{base}/botTEST/sendMessage"
+        before = asyncio.run(per_call_client(url, args.requests, args.concurrency))
+        after = asyncio.run(pooled_client(url, args.requests, args.concurrency))
+    print(f"per-call client : {before:8.1f} req/s")
+    print(f"pooled client   : {after:8.1f} req/s  (x{after / before:.2f})")
+
+if __name__ == "__main__":
+    main()
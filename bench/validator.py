@@ -0,0 +1,33 @@
+"""
+قياس فاحص بنية الخطط: خطط/ثانية لدفعة خطط نموذجية، وزمن خطة واحدة بآلاف الخطوات.
+
+    python -m bench.validator [--batch 5000] [--sizes 1000,10000]
+"""
+from __future__ import annotations
+import argparse, time
+
+from app.validators import validate_many, validate_plan
+from bench.synthetic import synthetic_plan
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch", type=int, default=5000)
+    ap.add_argument("--sizes", default="1000,10000")
+    args = ap.parse_args()
+
+    plans = [synthetic_plan(8, seed=i) for i in range(args.batch)]
+    t0 = time.perf_counter()
+    results = validate_many(plans)
+    dt = time.perf_counter() - t0
+    assert not any(results)
+    print(f"batch {args.batch} x 8 steps : {dt * 1000:8.2f} ms  ({args.batch / dt:,.0f} plans/s)")
+
+    for n in (int(x) for x in args.sizes.split(",")):
+        plan = synthetic_plan(n)
+        t0 = time.perf_counter()
+        validate_plan(plan)
+        dt = time.perf_counter() - t0
+        print(f"single {n:>6} steps   : {dt * 1000:8.2f} ms  ({n / dt:,.0f} steps/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import time, json, socket, asyncio, sqlite3
+
+import pytest
+
+from app import state
+from app import journal as J
+from app.dedup import UpdateDeduper
+from app.ratelimit import RateLimiter
+from bench.stubs import StubRedis
+
+# الـ backends الثلاثة بنفس الدلالات: memory، sqlite (WAL)، و redis عبر StubRedis (خادم RESP محلي)
+
+@pytest.fixture(scope="module")
+def redis_url():
+    with StubRedis() as url:
+        yield url
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        b = state.MemoryBackend()
+    elif request.param == "sqlite":
+        b = state.SqliteBackend(str(tmp_path / "state.db"))
+    else:
+        b = state.RedisBackend(request.getfixturevalue("redis_url"), prefix=f"t{time.time_ns()}:")
+    yield b
+    b.close()
+
+def _dead_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+# ==== backends ====
+
+def test_add_many_marks_only_new_keys(backend):
+    assert backend.add_many(["a", "b"], 60) == [True, True]
+    assert backend.add_many(["b", "c"], 60) == [False, True]
+    assert backend.add_many([], 60) == []
+
+def test_add_many_expires(backend):
+    assert backend.add_many(["k"], 0.05) == [True]
+    time.sleep(0.1)
+    assert backend.add_many(["k"], 0.05) == [True]
+
+def test_incr_many_counts_per_fixed_window(backend):
+    assert backend.incr_many([("g", 0.2), ("c", 0.2)]) == [1, 1]
+    assert backend.incr_many([("g", 0.2), ("c", 0.2)]) == [2, 2]
+    time.sleep(0.25)
+    assert backend.incr_many([("g", 0.2)]) == [1]  # النافذة انتهت: عدّاد جديد
+
+def test_incr_many_sets_ttl_on_redis_before_7():
+    with StubRedis(version=6) as url:
+        b = state.RedisBackend(url)
+        assert b.incr_many([("rl:g:1", 2)] * 3) == [1, 2, 3]
+        ttl = b.pipeline([["PTTL", b._k("rl:g:1")]])[0]
+        assert 0 < ttl <= 2000
+        b.close()
+
+def test_lease_handoff(backend):
+    assert backend.acquire_lease("lease", "a", 60)
+    assert not backend.acquire_lease("lease", "b", 60)
+    assert backend.acquire_lease("lease", "a", 60)  # تجديد
+    backend.release_lease("lease", "b")  # ليس المالك: لا شيء
+    assert not backend.acquire_lease("lease", "b", 60)
+    backend.release_lease("lease", "a")
+    assert backend.acquire_lease("lease", "b", 0.05)
+    time.sleep(0.1)
+    assert backend.acquire_lease("lease", "a", 60)  # القفل انتهى وحده
+
+def test_get_set_delete(backend):
+    assert backend.get("x") is None
+    backend.set("x", "1", 60)
+    assert backend.get("x") == "1"
+    backend.delete("x")
+    assert backend.get("x") is None
+
+# ==== fail open ====
+
+def test_guarded_marks_backend_unavailable(monkeypatch):
+    monkeypatch.setattr(state, "STATE_RETRY_AFTER", 60)
+    b = state.RedisBackend(f"redis://127.0.0.1:{_dead_port()}/0")
+    with pytest.raises(state.StateUnavailable):
+        b.guarded("get", "k")
+    assert not b.available and b.failures == 1
+    with pytest.raises(state.StateUnavailable):
+        b.guarded("get", "k")  # لا محاولة اتصال أثناء فترة التعطل
+    assert b.failures == 1
+    store = state.SharedStore(b, "plan")
+    assert store.get("k") is None
+    store.set("k", "v")
+
+def test_reply_error_does_not_trip_breaker(redis_url):
+    b = state.RedisBackend(redis_url)
+    with pytest.raises(state.RedisReplyError):
+        b.guarded("pipeline", [["NOPE", "k"]])
+    assert b.available and b.failures == 0
+    b.close()
+
+def test_dedup_and_rate_windows_fail_open():
+    b = state.RedisBackend(f"redis://127.0.0.1:{_dead_port()}/0")
+    deduper = UpdateDeduper(backend=b)
+    limiter = RateLimiter(backend=b)
+
+    async def run():
+        first = await deduper.seen({"update_id": 1})
+        again = await deduper.seen({"update_id": 1})
+        return first, again, await limiter.shared_delay(5)
+
+    assert asyncio.run(run()) == (False, True, 0.0)
+    assert deduper.fallbacks == 2
+
+# ==== journal ====
+
+def _journal(tmp_path, rows, beats=()):
+    path = str(tmp_path / "jobs.db")
+    db = J.JobJournal._open(path)
+    db.executemany("INSERT INTO events (job, stage, owner, data, ts) VALUES (?, ?, ?, ?, ?)", rows)
+    db.executemany("INSERT INTO owners VALUES (?, ?)", beats)
+    db.close()
+    return path
+
+def _accepted(job, owner, ts, chat_id=1):
+    return (job, J.ACCEPTED, owner, json.dumps({"chat_id": chat_id, "text": "t", "update_id": 7}), ts)
+
+def _outcomes(path):
+    db = sqlite3.connect(path)
+    rows = db.execute("SELECT job, data FROM events WHERE stage = ?", (J.DONE,)).fetchall()
+    db.close()
+    return {job: json.loads(data)["outcome"] for job, data in rows}
+
+def _recover(path):
+    """recover() من عملية جديدة على نسخة أخرى → (المهام المأخوذة, نتائج DONE المسجلة)."""
+    async def run():
+        j = J.JobJournal(path, instance="new-pod")
+        claimed = await j.recover()
+        await j.close()
+        return claimed
+    claimed = asyncio.run(run())
+    return claimed, _outcomes(path)
+
+def test_recover_claims_jobs_of_owner_from_another_host(tmp_path):
+    now = time.time()
+    plan = {"name": "p", "steps": [], "edges": []}
+    path = _journal(tmp_path, [
+        _accepted("a", "srv-old-pod-abc:7:1.0", now),
+        ("a", J.PLANNED, "srv-old-pod-abc:7:1.0", json.dumps({"plan": plan}), now),
+    ])
+    first, _ = _recover(path)
+    assert [(j.job_id, j.plan) for j in first] == [("a", plan)]
+    second, _ = _recover(path)
+    assert [j.job_id for j in second] == ["a"]  # العملية السابقة أُغلقت: تؤخذ مرة أخرى
+
+def test_recover_leaves_live_owner_but_expires_old_jobs(tmp_path):
+    now = time.time()
+    path = _journal(tmp_path, [
+        _accepted("live", "other-pod:5:1.0", now),
+        _accepted("old", "other-pod:5:1.0", now - J.JOURNAL_MAX_AGE - 60),
+    ], beats=[("other-pod:5:1.0", now)])
+    first, outcomes = _recover(path)
+    assert first == []
+    assert outcomes == {"old": "expired"}
+
+def test_recover_abandons_after_max_resumes(tmp_path):
+    now = time.time()
+    rows = [_accepted("a", "gone:9:1.0", now)]
+    rows += [("a", J.RESUMED, "gone:9:1.0", None, now)] * J.JOURNAL_MAX_RESUMES
+    path = _journal(tmp_path, rows)
+    first, outcomes = _recover(path)
+    assert first == []
+    assert outcomes == {"a": "abandoned"}
+
+def test_recover_drops_corrupt_rows_and_compacts(tmp_path):
+    now = time.time()
+    path = _journal(tmp_path, [
+        ("bad", J.ACCEPTED, "gone:9:1.0", json.dumps({"text": "no chat"}), now),
+        _accepted("badplan", "gone:9:1.0", now),
+        ("badplan", J.PLANNED, "gone:9:1.0", "not json", now),
+        _accepted("ok", "gone:9:1.0", now),
+        ("finished", J.ACCEPTED, "gone:9:1.0", json.dumps({"chat_id": 1, "text": "t"}), now),
+        ("finished", J.DONE, "gone:9:1.0", json.dumps({"outcome": "sent"}), now),
+    ])
+    first, outcomes = _recover(path)
+    assert [j.job_id for j in first] == ["ok"]
+    assert outcomes == {"bad": "corrupt", "badplan": "corrupt"}
+    _recover(path)  # الضغط: أسطر المهام المنتهية تُحذف
+    assert _outcomes(path) == {}
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM events WHERE job = 'finished'").fetchone()[0] == 0
+    db.close()